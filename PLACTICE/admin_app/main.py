@@ -1,8 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, render_template, request, redirect, url_for, abort
 from flask_login import login_required, current_user
-from shared.models.users import Post, User, AnswerRecord, Genre, Unit
+from shared.models.users import Post, User, Genre, Unit, SqlStat
 from shared.db import db
 from shared.auth import roles_required
+from shared.catalog import catalog, bump_catalog_version
+from shared.page_cache import conditional_response, make_etag, fragment_cache
+from shared.sql_stats import sql_stats
+from shared.user_cache import user_cache
+from shared.analytics import analytics
+from shared.purge import run_purge
+from shared.search import search_posts
+from sqlalchemy import func
+from markupsafe import Markup
+from flask import current_app, Response, stream_with_context
+from admin_app.question_io import read_rows, import_rows, genre_unit_resolver, export_rows, export_query
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -44,6 +55,7 @@ def update_role(user_id):
     if new_role in ['admin', 'player']:
         user.role = new_role
         db.session.commit()
+        user_cache.invalidate(user.id)
     return redirect(url_for('admin.users'))
 
 #ユーザー削除処理
@@ -64,10 +76,13 @@ def delete_user(user_id):
     if user.role == 'admin':
             return "他の管理者を削除することはできません", 403
 
-    AnswerRecord.query.filter_by(user_id=user.id).delete()
-    
-    db.session.delete(user)
-    db.session.commit()
+    # 解答履歴・成績は ON DELETE CASCADE で一緒に消える
+    if current_app.config['DELETE_IN_BACKGROUND']:
+        run_purge('user', user.id)
+    else:
+        db.session.delete(user)
+        db.session.commit()
+    user_cache.invalidate(user_id)
     return redirect(url_for('admin.users'))
 
 #ジャンル選択画面
@@ -75,8 +90,13 @@ def delete_user(user_id):
 @login_required
 @roles_required('admin')
 def genre_list():
-    genres = Genre.query.all()
-    return render_template('genre.html', genres=genres)
+    version = catalog.version
+
+    def render():
+        genre_list = fragment_cache.get(('admin.genre_list',), version, lambda: Markup(
+            render_template('_genre_list.html', genres=Genre.query.all())))
+        return render_template('genre.html', genre_list=genre_list)
+    return conditional_response(make_etag('admin.genre_list', version), [catalog.updated_at], render)
 
 #ジャンル作成画面
 @admin_bp.route('/genre_create', methods=['GET','POST'])
@@ -90,6 +110,7 @@ def genre_create():
             new_genre = Genre(name=genre_name)
             
             db.session.add(new_genre)
+            bump_catalog_version()
             db.session.commit()
             return redirect('/genre')
     return render_template('genre_create.html')
@@ -108,6 +129,7 @@ def genre_edit():
             if new_name:
                 genre.name = new_name
 
+        bump_catalog_version()
         db.session.commit()
         return redirect('/genre')
 
@@ -120,8 +142,13 @@ def genre_edit():
 def delete_genre(id):
     genre = Genre.query.get_or_404(id)
 
-    db.session.delete(genre)
-    db.session.commit()
+    # 単元・問題・解答履歴は ON DELETE CASCADE で一緒に消える
+    if current_app.config['DELETE_IN_BACKGROUND']:
+        run_purge('genre', genre.id)
+    else:
+        db.session.delete(genre)
+        bump_catalog_version()
+        db.session.commit()
     return redirect(url_for('admin.genre_list'))
 
 #単元選択画面
@@ -129,17 +156,24 @@ def delete_genre(id):
 @login_required
 @roles_required('admin')
 def unit_list(genre_id):
-    genre = Genre.query.get_or_404(genre_id)
-    units = Unit.query.filter_by(genre_id=genre_id).all()
-
     if request.method == 'POST':
+        genre = Genre.query.get_or_404(genre_id)
         unit_name = request.form.get('name')
         new_unit = Unit(name=unit_name, genre_id=genre.id)
 
         db.session.add(new_unit)
+        bump_catalog_version()
         db.session.commit()
         return redirect(url_for('admin.unit_list', genre_id=genre_id))
-    return render_template('unit.html', genre=genre, units=units)
+
+    genre = catalog.get_genre(genre_id) or abort(404)
+    version = catalog.version
+
+    def render():
+        unit_list = fragment_cache.get(('admin.unit_list', genre_id), version, lambda: Markup(
+            render_template('_unit_list.html', genre=genre, units=Unit.query.filter_by(genre_id=genre_id).all())))
+        return render_template('unit.html', genre=genre, unit_list=unit_list)
+    return conditional_response(make_etag('admin.unit_list', genre_id, version), [catalog.updated_at], render)
 
 #単元作成画面
 @admin_bp.route('/unit_create', methods=['GET','POST'])
@@ -153,6 +187,7 @@ def unit_create():
             new_unit = Unit(name=unit_name)
             
             db.session.add(new_unit)
+            bump_catalog_version()
             db.session.commit()
             return redirect('/unit')
     
@@ -173,6 +208,7 @@ def unit_edit(genre_id):
             if new_name:
                 unit.name = new_name
 
+        bump_catalog_version()
         db.session.commit()
         return redirect(url_for('admin.unit_list', genre_id=genre_id))
     return render_template('unit_update.html', genre=genre, units=units)
@@ -185,8 +221,12 @@ def delete_unit(id):
     unit = Unit.query.get_or_404(id)
     genre_id=unit.genre_id
 
-    db.session.delete(unit)
-    db.session.commit()
+    if current_app.config['DELETE_IN_BACKGROUND']:
+        run_purge('unit', unit.id)
+    else:
+        db.session.delete(unit)
+        bump_catalog_version()
+        db.session.commit()
     return redirect(url_for('admin.unit_list', genre_id=genre_id))
 
 #問題作成画面
@@ -194,10 +234,39 @@ def delete_unit(id):
 @login_required
 @roles_required('admin')
 def unit_home(unit_id, genre_id):
+        # 集計の足し込みはコミットするため、読み込んだ行が期限切れにならないよう先に行う
+        analytics.check()
         genre = Genre.query.get_or_404(genre_id)
         unit = Unit.query.get_or_404(unit_id)
-        posts = Post.query.filter_by(unit_id=unit_id).all()
-        return render_template('unit_home.html', genre=genre, unit=unit, posts=posts)
+        page_size = current_app.config.get('ADMIN_PAGE_SIZE', 50)
+
+        # (unit_id, id) のインデックスを after の続きから読むキーセットでページ送りする
+        after = request.args.get('after', 0, type=int)
+        posts = Post.query.filter(Post.unit_id == unit_id, Post.id > after).order_by(
+            Post.id.asc()).limit(page_size + 1).all()
+        next_after = None
+        if len(posts) > page_size:
+            posts = posts[:page_size]
+            next_after = posts[-1].id
+
+        post_count = db.session.query(func.count(Post.id)).filter(Post.unit_id == unit_id).scalar()
+        stats = analytics.get_unit(unit_id, posts)
+        return render_template('unit_home.html', genre=genre, unit=unit, posts=posts, stats=stats,
+                               post_count=post_count, next_after=next_after, is_first_page=not after)
+
+#問題検索（全ジャンル・単元の問題文と選択肢）
+@admin_bp.route('/search')
+@login_required
+@roles_required('admin')
+def search():
+    q = request.args.get('q', '').strip()
+    after = request.args.get('after', 0, type=int)
+    page_size = current_app.config.get('ADMIN_PAGE_SIZE', 50)
+
+    posts, next_after = [], None
+    if q:
+        posts, next_after = search_posts(q, after, page_size, current_app.config.get('SEARCH_SCAN_ROWS', 5000))
+    return render_template('search.html', q=q, posts=posts, next_after=next_after, is_first_page=not after)
 
 #問題作成ページ
 @admin_bp.route('/create/<int:unit_id>', methods=['GET', 'POST'])
@@ -230,6 +299,7 @@ def create(unit_id):
             unit_id=unit_id
         )
         db.session.add(post)
+        bump_catalog_version()
         db.session.commit()
         
         return redirect(url_for('admin.unit_home', genre_id = unit.genre_id, unit_id = unit.id))
@@ -261,6 +331,7 @@ def update(id):
         post.select3 = request.form.get('select3')
         post.select4 = request.form.get('select4')
         post.answer = request.form.get('answer')
+        bump_catalog_version()
         db.session.commit()
 
         return redirect(url_for('admin.unit_home', genre_id=post.unit.genre_id, unit_id=post.unit.id))
@@ -276,6 +347,7 @@ def delete_post(post_id):
     genre_id = unit.genre.id
 
     db.session.delete(post)
+    bump_catalog_version()
     db.session.commit()
     return redirect(url_for('admin.unit_home', genre_id=genre_id, unit_id=unit.id))
 
@@ -287,6 +359,81 @@ def show_users():
     users = User.query.all()
     return '<br>'.join([f"ID: {u.id} | ユーザー名: {u.username} | パスワード: {u.password}" for u in users])
 
+#問題の一括書き出し（単元単位 / ジャンル単位）
+@admin_bp.route('/export/unit/<int:unit_id>')
+@login_required
+@roles_required('admin')
+def export_unit(unit_id):
+    unit = Unit.query.get_or_404(unit_id)
+    return export_response(export_query(unit_id=unit.id), f'unit_{unit.id}')
+
+@admin_bp.route('/export/genre/<int:genre_id>')
+@login_required
+@roles_required('admin')
+def export_genre(genre_id):
+    genre = Genre.query.get_or_404(genre_id)
+    return export_response(export_query(genre_id=genre.id), f'genre_{genre.id}')
+
+def export_response(query, name):
+    fmt = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    mimetype = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    return Response(stream_with_context(export_rows(query, fmt)), mimetype=f'{mimetype}; charset=utf-8',
+                    headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'})
+
+#問題の一括取り込み（CSV / JSONL）
+@admin_bp.route('/import/unit/<int:unit_id>', methods=['GET', 'POST'])
+@login_required
+@roles_required('admin')
+def import_unit(unit_id):
+    unit = Unit.query.get_or_404(unit_id)
+    genre = Genre.query.get_or_404(unit.genre_id)
+    return import_questions(genre, unit, lambda row: unit.id)
+
+@admin_bp.route('/import/genre/<int:genre_id>', methods=['GET', 'POST'])
+@login_required
+@roles_required('admin')
+def import_genre(genre_id):
+    genre = Genre.query.get_or_404(genre_id)
+    return import_questions(genre, None, genre_unit_resolver(genre.id))
+
+def import_questions(genre, unit, unit_id_for):
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return render_template('import.html', genre=genre, unit=unit, error='ファイルを選択してください')
+        fmt = 'jsonl' if upload.filename.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+        try:
+            imported, errors = import_rows(read_rows(upload.stream, fmt), unit_id_for,
+                                           chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 500))
+        except UnicodeDecodeError:
+            db.session.rollback()
+            return render_template('import.html', genre=genre, unit=unit, error='UTF-8 のファイルを選択してください')
+        if imported:
+            bump_catalog_version()
+        db.session.commit()
+        return render_template('import.html', genre=genre, unit=unit, imported=imported, errors=errors)
+    return render_template('import.html', genre=genre, unit=unit)
+
+#SQL計測ダッシュボード（エンドポイントごとの集計）
+@admin_bp.route('/sql_stats')
+@login_required
+@roles_required('admin')
+def sql_stats_dashboard():
+    sql_stats.flush(current_app._get_current_object())
+    stats = SqlStat.query.all()
+    stats.sort(key=lambda s: s.queries / s.requests if s.requests else 0, reverse=True)
+    return render_template('sql_stats.html', stats=stats)
+
+#SQL計測の集計をリセット
+@admin_bp.route('/sql_stats/reset', methods=['POST'])
+@login_required
+@roles_required('admin')
+def sql_stats_reset():
+    SqlStat.query.delete()
+    db.session.commit()
+    return redirect(url_for('admin.sql_stats_dashboard'))
+
 #問題を一覧表示（操作ボタン無し）
 # @admin_bp.route('/posts')
 # @login_required
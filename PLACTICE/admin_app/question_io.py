@@ -0,0 +1,119 @@
+from datetime import datetime
+from sqlalchemy import insert
+from shared.db import db
+from shared.models.users import Post, Unit
+import csv
+import io
+import json
+import pytz
+
+FIELDS = ['unit', 'question', 'select1', 'select2', 'select3', 'select4', 'answer']
+POST_FIELDS = FIELDS[1:]
+
+
+# アップロードされたファイルを1行ずつ読む（全体をメモリに載せない）
+def read_rows(stream, fmt):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for line_no, row in enumerate(csv.DictReader(text), start=2):
+            yield line_no, row
+    else:
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, None
+                continue
+            yield line_no, row if isinstance(row, dict) else None
+
+
+# 問題作成画面と同じ規則で1行を検証し、エラーメッセージを返す
+def validate_row(row):
+    if row is None:
+        return '行を読み取れません'
+    for field in POST_FIELDS:
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return f'{field} が空です'
+        max_length = Post.__table__.c[field].type.length
+        if len(value) > max_length:
+            return f'{field} が長すぎます（{max_length}文字まで）'
+    if row['answer'] not in [row['select1'], row['select2'], row['select3'], row['select4']]:
+        return '正答は選択肢のいずれかと一致している必要があります。'
+    return None
+
+
+# 検証済みの行をチャンクごとにまとめてINSERTする（コミットは呼び出し側で1回）
+# unit_id_for は行から単元IDを決める関数。決められない場合は None を返す
+def import_rows(rows, unit_id_for, chunk_size=500):
+    now = datetime.now(pytz.timezone('Asia/Tokyo'))
+    errors = []
+    imported = 0
+    chunk = []
+    for line_no, row in rows:
+        error = validate_row(row)
+        unit_id = None
+        if error is None:
+            unit_id = unit_id_for(row)
+            if unit_id is None:
+                error = '単元が見つかりません'
+        if error:
+            errors.append((line_no, error))
+            continue
+
+        chunk.append(dict({field: row[field] for field in POST_FIELDS}, unit_id=unit_id, created_at=now))
+        if len(chunk) >= chunk_size:
+            db.session.execute(insert(Post), chunk)
+            imported += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(Post), chunk)
+        imported += len(chunk)
+    return imported, errors
+
+
+# ジャンル単位の取り込みで、単元名から単元IDを引く（無ければ作成する）
+def genre_unit_resolver(genre_id):
+    units = {u.name: u.id for u in Unit.query.filter_by(genre_id=genre_id).all()}
+
+    def unit_id_for(row):
+        name = (row.get('unit') or '').strip()
+        if not name:
+            return None
+        if name not in units:
+            unit = Unit(name=name, genre_id=genre_id)
+            db.session.add(unit)
+            db.session.flush()
+            units[name] = unit.id
+        return units[name]
+    return unit_id_for
+
+
+# 問題を1行ずつ書き出す（yield_per でサーバ側のメモリを一定に保つ）
+def export_rows(query, fmt, chunk_size=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(FIELDS)
+    for unit_name, post in query.yield_per(chunk_size):
+        values = [unit_name, post.question, post.select1, post.select2, post.select3, post.select4, post.answer]
+        if fmt == 'csv':
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False) + '\n')
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_query(**filters):
+    query = db.session.query(Unit.name, Post).join(Unit, Unit.id == Post.unit_id)
+    if 'unit_id' in filters:
+        query = query.filter(Post.unit_id == filters['unit_id'])
+    if 'genre_id' in filters:
+        query = query.filter(Unit.genre_id == filters['genre_id'])
+    return query.order_by(Post.unit_id.asc(), Post.id.asc())
@@ -0,0 +1,83 @@
+# 解答記録の書き込み方式（1件ずつコミット / バッファ経由の一括INSERT）をSQLiteで比較する
+#   python -m bench.answer_ingest --answers 2000 --threads 8
+from sqlalchemy import event
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def run(mode, answers, threads, posts):
+    from quiz_app import quiz_app
+    from shared.db import db
+    from shared.catalog import catalog
+    from shared.answer_buffer import answer_buffer
+    from shared.models.users import AnswerRecord
+    from bench.seed import seed
+    from bench.report import summarize
+
+    path = os.path.join(tempfile.mkdtemp(), f'{mode}.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    os.environ['ANSWER_BUFFER_ENABLED'] = '1' if mode == 'buffered' else '0'
+    catalog.clear()
+
+    app = quiz_app()
+    with app.app_context():
+        db.create_all()
+        seed(genres=1, units=1, posts=posts, users=threads)
+        commits = [0]
+        event.listen(db.engine, 'commit', lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    latencies = []
+    per_thread = answers // threads
+
+    clients = {}
+    for n in range(1, threads + 1):
+        clients[n] = app.test_client()
+        clients[n].post('/', data=dict(username=f'user{n}', password='password'))
+
+    def worker(n):
+        client = clients[n]
+        mine = []
+        for i in range(per_thread):
+            post_id = i % posts + 1
+            start = time.perf_counter()
+            client.post(f'/answer/{post_id}', data=dict(selected='a'))
+            mine.append(time.perf_counter() - start)
+        latencies.extend(mine)
+
+    commits[0] = 0
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(1, threads + 1)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    answer_buffer.flush()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        stored = AnswerRecord.query.count()
+
+    result = dict(mode=mode, answers=len(latencies), stored=stored, seconds=round(elapsed, 3),
+                  answers_per_sec=round(len(latencies) / elapsed, 1), commits=commits[0],
+                  commits_per_sec=round(commits[0] / elapsed, 1))
+    result.update(summarize(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--answers', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--posts', type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run(mode, args.answers, args.threads, args.posts) for mode in ('direct', 'buffered')]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# クイズの一連の流れを複数ユーザーで同時に実行し、エンドポイントごとの性能を計測する
+#   python -m bench.loadtest --users 20 --concurrency 8 --out results.json
+#   python -m bench.loadtest --compare results.json   # 前回の結果と比較（悪化があれば終了コード1）
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import event
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+
+_local = threading.local()
+
+
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'statements', None) is not None:
+        _local.statements += 1
+
+
+class LoginFailed(Exception):
+    pass
+
+
+# ログイン画面（/）へのリダイレクト。ログインが切れた・失敗したあとの応答で、速く返っても成功ではない
+def to_login(response):
+    return response.status_code in (301, 302, 303) and urlsplit(response.headers.get('Location', '')).path == '/'
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statements = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, name, func, *args, **kwargs):
+        _local.statements = 0
+        start = time.perf_counter()
+        response = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        statements = _local.statements
+        _local.statements = None
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            self.statements[name].append(statements)
+            if response.status_code >= 400 or to_login(response):
+                self.errors[name] += 1
+        return response
+
+    def fail(self, name):
+        with self._lock:
+            self.errors[name] += 1
+
+
+# ログインできなければ（503 や、ログイン画面がそのまま返った場合）以降の計測をしない
+def login(client, recorder, username):
+    response = recorder.call('auth.login', client.post, '/', data=dict(username=username, password='password'))
+    if response.status_code != 302 or to_login(response):
+        if response.status_code < 400:
+            recorder.fail('auth.login')
+        raise LoginFailed(f'{username}: {response.status_code}')
+
+
+def player_flow(app, recorder, user_id, genres, rounds):
+    client = app.test_client()
+    login(client, recorder, f'user{user_id}')
+    for n in range(rounds):
+        genre_id = (user_id + n) % genres + 1
+        recorder.call('quiz.home', client.get, '/home')
+        page = recorder.call('quiz.unit', client.get, f'/unit/{genre_id}').get_data(as_text=True)
+        links = re.findall(r'/quiz/(\d+)/start', page)
+        if not links:
+            continue
+        unit_id = links[(user_id + n) % len(links)]
+        response = recorder.call('quiz.start', client.post, f'/quiz/{unit_id}/start', data=dict(mode='order'))
+        url = response.headers.get('Location', '')
+        while url.startswith('/quiz/'):
+            recorder.call('quiz.quiz', client.get, url)
+            path, query = url.split('?', 1) if '?' in url else (url, '')
+            attempt_id = parse_qs(query).get('attempt', [''])[0]
+            response = recorder.call('quiz.answer', client.post, f"/answer/{path.rsplit('/', 1)[1]}",
+                                     data=dict(selected='a', attempt_id=attempt_id))
+            url = response.headers.get('Location', '')
+        recorder.call('quiz.result', client.get, url)
+        recorder.call('quiz.history', client.get, '/history')
+
+
+def admin_flow(app, recorder, genres, rounds):
+    client = app.test_client()
+    login(client, recorder, 'user1')
+    for n in range(rounds):
+        genre_id = n % genres + 1
+        recorder.call('admin.home', client.get, '/home')
+        recorder.call('admin.genre_list', client.get, '/genre')
+        page = recorder.call('admin.unit_list', client.get, f'/unit/{genre_id}').get_data(as_text=True)
+        for unit_id, genre_id in re.findall(r'/unit_home/(\d+)/(\d+)', page)[:3]:
+            recorder.call('admin.unit_home', client.get, f'/unit_home/{unit_id}/{genre_id}')
+
+
+def summarize_endpoints(recorder, seconds):
+    from bench.report import summarize
+
+    endpoints = {}
+    for name in sorted(recorder.latencies):
+        stats = summarize(recorder.latencies[name])
+        statements = recorder.statements[name]
+        stats.update(
+            throughput_rps=round(len(statements) / seconds, 2),
+            sql_per_request_avg=round(sum(statements) / len(statements), 2),
+            sql_per_request_max=max(statements),
+            errors=recorder.errors[name],
+        )
+        endpoints[name] = stats
+    return endpoints
+
+
+def run(args):
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+
+    os.environ.setdefault('AUTO_MIGRATE', '1')
+    from admin_app import admin_app
+    from quiz_app import quiz_app
+    from shared.db import db
+    from shared.catalog import catalog
+    from shared.answer_buffer import answer_buffer
+    from bench.seed import seed
+
+    # admin_app() がマイグレーションでスキーマを作成する（AUTO_MIGRATE）
+    admin = admin_app()
+    quiz = quiz_app()
+    catalog.clear()
+    with admin.app_context():
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+        dataset = seed(genres=args.genres, units=args.units, posts=args.posts,
+                       users=args.users, history=args.history, rng_seed=args.seed)
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+    with quiz.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+
+    recorder = Recorder()
+    players = list(range(2, args.users + 1))
+    semaphore = threading.Semaphore(args.concurrency)
+
+    def guarded(func, *a):
+        with semaphore:
+            try:
+                func(*a)
+            except LoginFailed as e:
+                print('login failed:', e, file=sys.stderr)
+
+    threads = [threading.Thread(target=guarded, args=(player_flow, quiz, recorder, user_id, args.genres, args.rounds))
+               for user_id in players]
+    threads.append(threading.Thread(target=guarded, args=(admin_flow, admin, recorder, args.genres, args.rounds)))
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    answer_buffer.flush()
+    seconds = time.perf_counter() - start
+
+    total = sum(len(v) for v in recorder.latencies.values())
+    return dict(
+        meta=dict(
+            created_at=datetime.utcnow().isoformat(),
+            python=platform.python_version(),
+            database=os.environ['DATABASE_URL'].split(':', 1)[0],
+            args=vars(args),
+            dataset=dataset,
+        ),
+        total=dict(requests=total, seconds=round(seconds, 3), throughput_rps=round(total / seconds, 2)),
+        endpoints=summarize_endpoints(recorder, seconds),
+    )
+
+
+# 前回の結果から p95 または SQL 数が閾値を超えて悪化したエンドポイントを返す
+def compare(current, baseline, threshold):
+    regressions = []
+    for name, stats in current['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base:
+            continue
+        if base['p95_ms'] and stats['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {stats['p95_ms']}ms")
+        if stats['errors'] > base.get('errors', 0):
+            regressions.append(f"{name}: errors {base.get('errors', 0)} -> {stats['errors']}")
+        # キャッシュの温まり方で多少ぶれるため平均で比較する
+        if stats['sql_per_request_avg'] > base['sql_per_request_avg'] + 0.5:
+            regressions.append(f"{name}: SQL/request {base['sql_per_request_avg']} -> {stats['sql_per_request_avg']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', help='省略時は一時ファイルのSQLite（既存データは削除される）')
+    parser.add_argument('--genres', type=int, default=3)
+    parser.add_argument('--units', type=int, default=10)
+    parser.add_argument('--posts', type=int, default=10)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--history', type=int, default=20, help='ユーザーごとの過去の解答回数')
+    parser.add_argument('--rounds', type=int, default=2, help='ユーザーごとに解く単元数')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='結果のJSONを保存するパス')
+    parser.add_argument('--compare', help='比較対象の結果JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='p95 の悪化を許容する割合')
+    args = parser.parse_args()
+
+    result = run(args)
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
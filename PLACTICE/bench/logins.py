@@ -0,0 +1,106 @@
+# 授業開始時のログイン集中を再現し、ログイン数/秒（コアあたり）と、その間のログイン済み画面の応答時間を計測する
+#   python -m bench.logins --logins 40 --workers 1
+#   python -m bench.logins --method pbkdf2:sha256:600000   # ハッシュのコストを変えて比べる
+#   python -m bench.logins --logins 40 --queue 0   # 空きを待たずにすぐ 503 にする
+# --workers 0 は同時に計算する数を制限しない（これまでの動作）
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def run(logins, method, workers, queue, wait):
+    path = os.path.join(tempfile.mkdtemp(), 'logins.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    os.environ['PASSWORD_HASH_METHOD'] = method
+    os.environ['PASSWORD_HASH_WORKERS'] = str(workers or logins)
+    os.environ['PASSWORD_HASH_QUEUE'] = str(queue)
+    os.environ['PASSWORD_HASH_WAIT'] = str(wait)
+    os.environ['PASSWORD_HASH_LOCK_DIR'] = tempfile.mkdtemp()
+
+    from quiz_app import quiz_app
+    from shared.db import db
+    from shared.models.users import User
+    from shared.passwords import password_hasher
+    from bench.report import summarize
+    from bench.seed import seed
+
+    app = quiz_app()
+    with app.app_context():
+        db.create_all()
+        seed(genres=1, units=1, posts=3, users=logins + 1)
+        # seed のハッシュを計測するコストで作り直す
+        password = password_hasher.hash('password')
+        User.query.update({User.password: password})
+        db.session.commit()
+
+    reader = app.test_client()
+    reader.post('/', data=dict(username=f'user{logins + 1}', password='password'))
+
+    statuses = []
+    login_latencies = []
+    page_latencies = []
+    lock = threading.Lock()
+    storm = threading.Event()
+
+    def login(n):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/', data=dict(username=f'user{n}', password='password'))
+        with lock:
+            statuses.append(response.status_code)
+            if response.status_code == 302:
+                login_latencies.append(time.perf_counter() - start)
+
+    def read_pages():
+        while not storm.is_set():
+            start = time.perf_counter()
+            reader.get('/home')
+            page_latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    page_thread = threading.Thread(target=read_pages)
+    page_thread.start()
+    threads = [threading.Thread(target=login, args=(n,)) for n in range(1, logins + 1)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    storm.set()
+    page_thread.join()
+
+    succeeded = statuses.count(302)
+    return dict(
+        method=method, cores=cores(), hash_workers=workers or 'unbounded', queue=queue, wait=wait,
+        logins=logins, succeeded=succeeded, rejected_503=statuses.count(503), seconds=round(seconds, 2),
+        logins_per_second=round(succeeded / seconds, 2),
+        logins_per_second_per_core=round(succeeded / seconds / cores(), 2),
+        login=summarize(login_latencies), logged_in_page=summarize(page_latencies),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=40, help='同時にログインする人数')
+    parser.add_argument('--method', default='pbkdf2:sha256:1000000')
+    parser.add_argument('--workers', type=int, default=1, help='同時にハッシュを計算する数（超えると 503。0 は制限なし）')
+    parser.add_argument('--queue', type=int, default=32, help='計算の空きを待てる数（超えると 503）')
+    parser.add_argument('--wait', type=int, default=10, help='空きを待つ秒数（超えると 503）')
+    args = parser.parse_args()
+    print(json.dumps(run(args.logins, args.method, args.workers, args.queue, args.wait), indent=2,
+                     ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# 読み取り用レプリカへの振り分けを SQLite のファイル2つで確認する（レプリカはシード直後のコピーで、以降は複製されない）
+# 画面ごとにプライマリ・レプリカへ送ったSQLの件数を出す
+#   python -m bench.replica --lag-tolerance 1
+from collections import defaultdict
+from flask import has_request_context
+from sqlalchemy import event
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+def run(lag_tolerance):
+    directory = tempfile.mkdtemp()
+    primary = os.path.join(directory, 'primary.db')
+    replica = os.path.join(directory, 'replica.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + primary
+    os.environ['DATABASE_REPLICA_URL'] = 'sqlite:///' + replica
+    os.environ['DB_REPLICA_LAG_TOLERANCE'] = str(lag_tolerance)
+
+    from quiz_app import quiz_app
+    from shared.db import db, REPLICA_BIND
+    from bench.seed import seed
+
+    app = quiz_app()
+    with app.app_context():
+        db.create_all()
+        seed(genres=1, units=1, posts=3, users=2)
+        db.engine.dispose()
+    shutil.copyfile(primary, replica)
+
+    steps = []
+    counts = None
+
+    def count(engine_name):
+        def listener(conn, cursor, statement, parameters, context, executemany):
+            if counts is not None and has_request_context():
+                counts[engine_name] += 1
+        return listener
+
+    with app.app_context():
+        event.listen(db.engines[None], 'before_cursor_execute', count('primary'))
+        event.listen(db.engines[REPLICA_BIND], 'before_cursor_execute', count('replica'))
+
+    client = app.test_client()
+
+    def call(label, method, url, **kwargs):
+        nonlocal counts
+        counts = defaultdict(int)
+        response = getattr(client, method)(url, **kwargs)
+        steps.append(dict(step=label, endpoint=request_endpoint(app, url, method), status=response.status_code,
+                          **counts))
+        counts = None
+        return response
+
+    call('login', 'post', '/', data=dict(username='user2', password='password'))
+    call('home', 'get', '/home')
+    call('mypage (before)', 'get', '/mypage')
+    for post_id in (1, 2, 3):
+        call('quiz', 'get', f'/quiz/1/1/{post_id}')
+        call('answer', 'post', f'/answer/{post_id}', data=dict(selected='a'))
+    call('result', 'get', '/result_unit/1')
+    page = call('mypage (read-after-write)', 'get', '/mypage').get_data(as_text=True)
+    steps[-1]['shows_attempt'] = 'unit1' in page
+    time.sleep(lag_tolerance + 0.1)
+    page = call('mypage (after lag tolerance)', 'get', '/mypage').get_data(as_text=True)
+    # レプリカには複製していないため、ここでは解答前の内容が見える
+    steps[-1]['shows_attempt'] = 'unit1' in page
+    return steps
+
+
+def request_endpoint(app, url, method):
+    adapter = app.url_map.bind('localhost')
+    try:
+        return adapter.match(url, method=method.upper())[0]
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lag-tolerance', type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.lag_tolerance), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+# 計測値の集計
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(latencies):
+    return dict(
+        count=len(latencies),
+        p50_ms=round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        p95_ms=round(percentile(latencies, 95) * 1000, 3) if latencies else None,
+        p99_ms=round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+    )
@@ -0,0 +1,139 @@
+# 解答記録の保存期間処理（archive-answers）の前後で、テーブルの大きさと利用者ごとのクエリの速さを比べる
+#   python -m bench.retention --users 2000 --history 100   # 約200万件
+#   python -m bench.retention --archive-dir /tmp/answer_archive
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, text
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+TABLES = ('answer_record', 'answer_record_archive', 'answer_rollup')
+
+
+def table_sizes():
+    from shared.db import db
+
+    sizes = {}
+    for name in TABLES:
+        if db.engine.dialect.name == 'postgresql':
+            size = db.session.execute(text('SELECT pg_total_relation_size(:name)'), dict(name=name)).scalar()
+        else:
+            # テーブル本体とインデックスのページ数の合計（dbstat が無効な SQLite では取れない）
+            try:
+                size = db.session.execute(text(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name = :name OR name IN "
+                    "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name)"),
+                    dict(name=name)).scalar()
+            except Exception:
+                db.session.rollback()
+                size = None
+        rows = db.session.execute(text(f'SELECT COUNT(*) FROM {name}')).scalar()
+        sizes[name] = dict(rows=rows, bytes=size)
+    return sizes
+
+
+# 解答記録を引く主なクエリ（結果画面の直近の解答・利用者ごとの全解答の読み出し）を利用者を変えながら計測する
+def query_latencies(users, unit_posts, samples, rng_seed=1):
+    from shared.db import db
+    from shared.models.users import AnswerRecord
+    from bench.report import summarize
+
+    rng = random.Random(rng_seed)
+    latest = []
+    per_user = []
+    for _ in range(samples):
+        user_id = rng.randint(2, users)
+        post_ids = unit_posts[rng.randrange(len(unit_posts))]
+
+        start = time.perf_counter()
+        db.session.execute(select(AnswerRecord).where(
+            AnswerRecord.user_id == user_id, AnswerRecord.post_id.in_(post_ids)
+        ).order_by(AnswerRecord.answered_at.desc()).limit(len(post_ids))).all()
+        latest.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        db.session.execute(select(AnswerRecord.post_id, AnswerRecord.is_correct, AnswerRecord.answered_at).where(
+            AnswerRecord.user_id == user_id).order_by(AnswerRecord.answered_at.asc())).all()
+        per_user.append(time.perf_counter() - start)
+    db.session.rollback()
+    return {'直近の解答（ユーザー・問題）': summarize(latest), '利用者ごとの全解答': summarize(per_user)}
+
+
+def measure(users, unit_posts, samples):
+    from shared.db import db
+
+    if db.engine.dialect.name == 'sqlite':
+        # 削除した分の領域を返してから大きさを測る
+        db.session.commit()
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+            conn.exec_driver_sql('ANALYZE')
+    return dict(tables=table_sizes(), queries=query_latencies(users, unit_posts, samples))
+
+
+def run(users, history, posts, keep_ratio, samples, archive_dir, chunk_size):
+    path = os.path.join(tempfile.mkdtemp(), 'retention.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+
+    from quiz_app import quiz_app
+    from shared.db import db
+    from shared.analytics import analytics
+    from shared.models.users import AnswerRecord, Post
+    from shared.progress import backfill
+    from shared.retention import archive_answers
+    from bench.seed import seed
+
+    app = quiz_app()
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seeded = seed(genres=2, units=5, posts=posts, users=users, history=history)
+        seed_seconds = time.perf_counter() - start
+        analytics.refresh(db.session.query(func.max(AnswerRecord.id)).scalar() or 0)
+
+        unit_posts = {}
+        for post_id, unit_id in db.session.query(Post.id, Post.unit_id):
+            unit_posts.setdefault(unit_id, []).append(post_id)
+        unit_posts = list(unit_posts.values())
+
+        before = measure(users, unit_posts, samples)
+
+        # seed の解答日時は 2025-04-01 から1単元1時間ずつ進む。古い方から keep_ratio の残りを移す
+        cutoff = datetime(2025, 4, 1) + timedelta(hours=history * (1 - keep_ratio))
+        start = time.perf_counter()
+        moved = archive_answers(cutoff, chunk_size, archive_dir, echo=lambda *args: None)
+        archive_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        backfill(echo=lambda *args: None)
+        backfill_seconds = time.perf_counter() - start
+
+        after = measure(users, unit_posts, samples)
+
+    return dict(seeded=seeded, seed_seconds=round(seed_seconds, 1), cutoff=cutoff.isoformat(),
+                archived=moved, archive_seconds=round(archive_seconds, 1),
+                archive_dir=archive_dir, backfill_seconds=round(backfill_seconds, 1),
+                before=before, after=after)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--history', type=int, default=100, help='1ユーザーあたりの単元解答の回数')
+    parser.add_argument('--posts', type=int, default=10, help='1単元あたりの問題数')
+    parser.add_argument('--keep-ratio', type=float, default=0.2, help='answer_record に残す新しい解答の割合')
+    parser.add_argument('--samples', type=int, default=500)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--archive-dir', help='指定すると answer_record_archive ではなく gzip ファイルに移す')
+    args = parser.parse_args()
+
+    result = run(args.users, args.history, args.posts, args.keep_ratio, args.samples, args.archive_dir,
+                 args.chunk_size)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
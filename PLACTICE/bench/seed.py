@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from shared.db import db
+from shared.models.users import User, Genre, Unit, Post, AnswerRecord, AnswerSession
+import random
+
+
+# ベンチマーク用のデータを空のDBに投入する（IDは1から連番）
+def seed(genres=2, units=5, posts=10, users=10, history=0, password='password', rng_seed=0):
+    password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+
+    db.session.execute(insert(User), [
+        dict(id=i, username=f'user{i}', password=password_hash, role='admin' if i == 1 else 'player')
+        for i in range(1, users + 1)
+    ])
+    db.session.execute(insert(Genre), [dict(id=g, name=f'genre{g}') for g in range(1, genres + 1)])
+
+    unit_rows = []
+    post_rows = []
+    for g in range(1, genres + 1):
+        for _ in range(units):
+            unit_id = len(unit_rows) + 1
+            unit_rows.append(dict(id=unit_id, name=f'unit{unit_id}', genre_id=g))
+            for _ in range(posts):
+                post_rows.append(dict(id=len(post_rows) + 1, question=f'question{len(post_rows) + 1}',
+                                      select1='a', select2='b', select3='c', select4='d',
+                                      answer='a', unit_id=unit_id))
+    db.session.execute(insert(Unit), unit_rows)
+    db.session.execute(insert(Post), post_rows)
+
+    # 過去の解答履歴（1ユーザーあたり history 回分の単元解答）
+    rng = random.Random(rng_seed)
+    unit_posts = {}
+    for row in post_rows:
+        unit_posts.setdefault(row['unit_id'], []).append(row['id'])
+    records = 0
+    sessions = 0
+    start = datetime(2025, 4, 1)
+    for user_id in range(2, users + 1):
+        record_rows = []
+        session_rows = []
+        for n in range(history):
+            unit_id = rng.randint(1, len(unit_rows))
+            started_at = start + timedelta(hours=n, minutes=user_id % 60)
+            correct = 0
+            for i, post_id in enumerate(unit_posts.get(unit_id, [])):
+                is_correct = rng.random() < 0.7
+                correct += is_correct
+                record_rows.append(dict(user_id=user_id, post_id=post_id,
+                                        selected_answer='a' if is_correct else rng.choice('bcd'),
+                                        is_correct=is_correct,
+                                        answered_at=started_at + timedelta(seconds=10 * i)))
+            session_rows.append(dict(user_id=user_id, unit_id=unit_id, started_at=started_at,
+                                     ended_at=started_at + timedelta(seconds=10 * posts),
+                                     correct_count=correct, total_count=len(unit_posts.get(unit_id, []))))
+        if record_rows:
+            db.session.execute(insert(AnswerRecord), record_rows)
+        if session_rows:
+            db.session.execute(insert(AnswerSession), session_rows)
+        records += len(record_rows)
+        sessions += len(session_rows)
+    db.session.commit()
+
+    return dict(users=users, genres=genres, units=len(unit_rows), posts=len(post_rows),
+                answer_records=records, answer_sessions=sessions)
@@ -0,0 +1,53 @@
+"""cascade deletes
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 20:05:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+# (テーブル, 列, 参照先) 親を消したときに DB 側でまとめて消す外部キー
+FOREIGN_KEYS = [
+    ('unit', 'genre_id', 'genre'),
+    ('answer_record', 'user_id', 'user'),
+    ('answer_record', 'post_id', 'post'),
+    ('answer_session', 'user_id', 'user'),
+    ('answer_session', 'unit_id', 'unit'),
+    ('user_unit_stat', 'user_id', 'user'),
+    ('user_unit_stat', 'unit_id', 'unit'),
+    ('user_post_stat', 'user_id', 'user'),
+    ('user_post_stat', 'post_id', 'post'),
+    ('post_answer_stat', 'post_id', 'post'),
+]
+
+# SQLite の外部キーは名前が無いため、バッチ処理で参照できるよう命名規則で名前を付ける
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def replace_foreign_keys(ondelete):
+    inspector = sa.inspect(op.get_bind())
+    for table in dict.fromkeys(t for t, _, _ in FOREIGN_KEYS):
+        existing = {fk['constrained_columns'][0]: fk['name'] for fk in inspector.get_foreign_keys(table)}
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            for _, column, referred in (fk for fk in FOREIGN_KEYS if fk[0] == table):
+                name = existing.get(column) or f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(f'fk_{table}_{column}_{referred}', referred, [column], ['id'],
+                                            ondelete=ondelete)
+
+
+def upgrade():
+    replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys(None)
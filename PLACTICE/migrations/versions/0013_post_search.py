@@ -0,0 +1,61 @@
+"""post full-text search
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 21:10:04.118532
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+# 問題文・選択肢の全文検索の索引。アプリ側（shared/search.py）が後で変わってもこのリビジョンの意味が変わらないよう、DDL はここに書く
+# SQLite は FTS5（trigram）の外部コンテンツテーブル post_fts と、post に追従するトリガー
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(question, select1, select2, select3, select4, "
+    "content='post', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_insert AFTER INSERT ON post BEGIN "
+    "INSERT INTO post_fts(rowid, question, select1, select2, select3, select4) "
+    "VALUES (new.id, new.question, new.select1, new.select2, new.select3, new.select4); END",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_delete AFTER DELETE ON post BEGIN "
+    "INSERT INTO post_fts(post_fts, rowid, question, select1, select2, select3, select4) "
+    "VALUES ('delete', old.id, old.question, old.select1, old.select2, old.select3, old.select4); END",
+    "CREATE TRIGGER IF NOT EXISTS post_fts_update AFTER UPDATE OF question, select1, select2, select3, select4 "
+    "ON post BEGIN "
+    "INSERT INTO post_fts(post_fts, rowid, question, select1, select2, select3, select4) "
+    "VALUES ('delete', old.id, old.question, old.select1, old.select2, old.select3, old.select4); "
+    "INSERT INTO post_fts(rowid, question, select1, select2, select3, select4) "
+    "VALUES (new.id, new.question, new.select1, new.select2, new.select3, new.select4); END",
+    "INSERT INTO post_fts(post_fts) VALUES ('rebuild')",
+]
+SQLITE_DOWNGRADE = [
+    'DROP TRIGGER IF EXISTS post_fts_insert',
+    'DROP TRIGGER IF EXISTS post_fts_delete',
+    'DROP TRIGGER IF EXISTS post_fts_update',
+    'DROP TABLE IF EXISTS post_fts',
+]
+# Postgres は tsvector の GIN 式インデックス（0014 で pg_trgm の索引に置き換える）
+POSTGRES_UPGRADE = [
+    "CREATE INDEX IF NOT EXISTS ix_post_search ON post USING gin (to_tsvector('simple', post.question || ' ' || "
+    "post.select1 || ' ' || post.select2 || ' ' || post.select3 || ' ' || post.select4))",
+]
+POSTGRES_DOWNGRADE = ['DROP INDEX IF EXISTS ix_post_search']
+
+
+# 注意: 以降のマイグレーションで batch_alter_table('post') を使うと post が作り直され、post_fts のトリガーが消える
+# （migrations/env.py が repair_search_index で作り直す。env.py を通さずに適用した場合は rebuild-search-index を実行する）
+def upgrade():
+    conn = op.get_bind()
+    for statement in {'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE}.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+
+def downgrade():
+    conn = op.get_bind()
+    for statement in {'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE}.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
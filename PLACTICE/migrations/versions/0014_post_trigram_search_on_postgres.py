@@ -0,0 +1,41 @@
+"""post trigram search on postgres
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18 20:28:11.793647
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+# 0013 で作っていた Postgres の索引（to_tsvector('simple', ...) は日本語を分かち書きせず、部分一致で引けない）
+LEGACY_DOCUMENT = "to_tsvector('simple', post.question || ' ' || post.select1 || ' ' || post.select2 || ' ' " \
+                  "|| post.select3 || ' ' || post.select4)"
+
+
+# 部分一致を ILIKE で引く pg_trgm の索引。検索条件の式（shared/search.py の POSTGRES_DOCUMENT）と一致させる
+TRIGRAM_DOCUMENT = "(post.question || ' ' || post.select1 || ' ' || post.select2 || ' ' || post.select3 || ' ' " \
+                   "|| post.select4)"
+
+
+# Postgres の全文検索を pg_trgm（gin_trgm_ops）の索引に置き換える。SQLite は 0013 の post_fts のまま
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('DROP INDEX IF EXISTS ix_post_search')
+        conn.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        conn.exec_driver_sql(
+            f'CREATE INDEX IF NOT EXISTS ix_post_search_trgm ON post USING gin ({TRIGRAM_DOCUMENT} gin_trgm_ops)')
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        conn.exec_driver_sql('DROP INDEX IF EXISTS ix_post_search_trgm')
+        conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS ix_post_search ON post USING gin ({LEGACY_DOCUMENT})')
@@ -0,0 +1,26 @@
+"""answer stat watermark row
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-18 20:31:12.367959
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+# 差分集計（shared/analytics.py）の watermark の行を作っておく（画面表示のたびに複数のワーカーが同時に作ろうとしないように）
+# 行が無かった既存の DB は全ての解答が未集計のため、適用後に flask refresh-analytics で集計しておく
+def upgrade():
+    op.execute("INSERT INTO answer_stat_watermark (id, last_record_id) "
+               "SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM answer_stat_watermark WHERE id = 1)")
+
+
+def downgrade():
+    pass
@@ -1,29 +1,49 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from shared.db import db
-from shared.models import users 
+from shared.db import db, replica_router
+from shared.config import load_config
+from shared.sql_stats import sql_stats
+from shared.user_cache import user_cache
+from shared.passwords import password_hasher
+from shared.assets import STATIC_DIR, assets, assets_bp, build_assets_command
+from shared.catalog import catalog
+from shared.page_cache import fragment_cache
+from shared.answer_buffer import answer_buffer
+from shared.leaderboard import leaderboard
+from shared.sampling import sampler
+from shared.startup import StartupTimer, configure_templates, precompile_templates_command
 from shared.auth import auth_bp, login_manager
 from quiz_app.main import quiz_bp
-from jinja2 import ChoiceLoader, FileSystemLoader
-import os
 
 def quiz_app():
-    app = Flask(__name__)
-    app.config['SECRET_KEY'] = os.urandom(24)
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    timer = StartupTimer()
+    with timer.phase('config'):
+        app = Flask(__name__, static_folder=STATIC_DIR)
+        load_config(app)
 
+    with timer.phase('templates'):
+        configure_templates(app, 'quiz_app')
 
-    app.jinja_loader = ChoiceLoader([
-        FileSystemLoader('quiz_app/templates'),
-        FileSystemLoader('shared/templates'),
-    ])
+    with timer.phase('extensions'):
+        db.init_app(app)
+        replica_router.init_app(app)
+        sql_stats.init_app(app)
+        catalog.init_app(app)
+        fragment_cache.init_app(app)
+        answer_buffer.init_app(app)
+        leaderboard.init_app(app)
+        sampler.init_app(app)
+        user_cache.init_app(app)
+        password_hasher.init_app(app)
+        assets.init_app(app)
+        login_manager.init_app(app)
+        login_manager.login_view = 'auth.login'
 
-    db.init_app(app)
-    login_manager.init_app(app)
-    login_manager.login_view = 'auth.login'
+    with timer.phase('blueprints'):
+        app.register_blueprint(assets_bp)
+        app.register_blueprint(auth_bp)
+        app.register_blueprint(quiz_bp)
+        app.cli.add_command(precompile_templates_command)
+        app.cli.add_command(build_assets_command)
 
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(quiz_bp)
-
-    return app
\ No newline at end of file
+    timer.finish(app)
+    return app
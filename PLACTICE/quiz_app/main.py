@@ -1,129 +1,485 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session
+from flask import Blueprint, render_template, request, redirect, url_for, session, abort, current_app, jsonify
 from flask_login import login_required, current_user
-from shared.models.users import User, Post, Genre,AnswerRecord, AnswerSession, Unit
-from shared.db import db
+from shared.models.users import Post, AnswerRecord, AnswerSession, Unit, UserUnitStat, QuizAttempt
+from shared.db import db, read_only
+from shared.catalog import catalog
+from shared.answer_buffer import answer_buffer
+from shared.progress import record_answers, record_attempt
+from shared.page_cache import conditional_response, make_etag, fragment_cache
+from shared.review import due_post_ids, queue_summary
+from shared.leaderboard import leaderboard
+from shared.sampling import sampler, MODES
+from shared.attempts import (start_attempt, get_attempt, latest_attempt, resolve_attempt, open_attempt,
+                             resumable_attempts, finish_attempt, attempt_answers)
+from sqlalchemy import func, tuple_, insert
+from sqlalchemy.orm import joinedload
 from datetime import datetime
+from markupsafe import Markup
+import pytz
 
 quiz_bp = Blueprint('quiz', __name__)
 
 
 @quiz_bp.route('/home')
 @login_required
+@read_only
 def home():
-    genres = Genre.query.all()
-    return render_template('home.html', genres=genres, user=current_user)
+    progress = db.session.query(
+        func.count(UserUnitStat.unit_id).label('units'),
+        func.coalesce(func.sum(UserUnitStat.attempts), 0).label('attempts'),
+        func.max(UserUnitStat.last_attempted_at).label('last_attempted_at')
+    ).filter(UserUnitStat.user_id == current_user.id).one()
+
+    version = catalog.version
+    etag = make_etag('quiz.home', version, current_user.id, current_user.username, progress.units, progress.attempts)
+
+    def render():
+        genre_list = fragment_cache.get(('quiz.home',), version, lambda: Markup(
+            render_template('_genre_list.html', genres=catalog.get_genres())))
+        return render_template('home.html', genre_list=genre_list, user=current_user, progress=progress)
+    return conditional_response(etag, [catalog.updated_at, progress.last_attempted_at], render)
+
+# 単元ごとの先頭問題ID・問題数を1クエリでまとめて取得し、1行ずつ描画する（カタログの版数ごとにキャッシュ）
+def unit_rows(genre):
+    post_stats = db.session.query(
+        Post.unit_id.label('unit_id'),
+        func.min(Post.id).label('first_post_id'),
+        func.count(Post.id).label('post_count')
+    ).join(Unit, Unit.id == Post.unit_id).filter(Unit.genre_id == genre.id).group_by(Post.unit_id).subquery()
+
+    units = db.session.query(
+        Unit.id, Unit.name,
+        post_stats.c.first_post_id,
+        post_stats.c.post_count
+    ).join(post_stats, post_stats.c.unit_id == Unit.id
+    ).filter(Unit.genre_id == genre.id).order_by(Unit.id.asc()).all()
+    return [(unit.id, Markup(render_template('_unit_row.html', genre=genre, unit=unit))) for unit in units]
 
-# quiz.py または quiz_bp の中
 @quiz_bp.route('/unit/<int:genre_id>')
 @login_required
+@read_only
 def unit(genre_id):
-    genre = Genre.query.get_or_404(genre_id)
-    units = Unit.query.filter_by(genre_id=genre_id).all()
-
-    unit_post_map = {}
-    for unit in units:
-        first_post = Post.query.filter_by(unit_id=unit.id).order_by(Post.id.asc()).first()
+    genre = catalog.get_genre(genre_id) or abort(404)
+    stats = {s.unit_id: s for s in UserUnitStat.query.join(Unit, Unit.id == UserUnitStat.unit_id).filter(
+        UserUnitStat.user_id == current_user.id, Unit.genre_id == genre_id)}
+    resumable = {a.unit_id for a in resumable_attempts(current_user.id).join(Unit, Unit.id == QuizAttempt.unit_id).filter(
+        Unit.genre_id == genre_id)}
 
-        if first_post:
-            unit_post_map[unit.id] = first_post.id
+    version = catalog.version
+    etag = make_etag('quiz.unit', genre_id, version, current_user.id,
+                     sorted((s.unit_id, s.attempts, s.last_attempted_at) for s in stats.values()), sorted(resumable))
+    last_attempted_at = max((s.last_attempted_at for s in stats.values() if s.last_attempted_at), default=None)
 
-    return render_template('unit.html', genre=genre, units=units, unit_post_map=unit_post_map)
+    def render():
+        rows = fragment_cache.get(('quiz.unit', genre_id), version, lambda: unit_rows(genre))
+        return render_template('unit.html', genre=genre, rows=rows, stats=stats, resumable=resumable)
+    return conditional_response(etag, [catalog.updated_at, last_attempted_at], render)
 
+# 挑戦を始めることがある（open_attempt / resolve_attempt）ため @read_only は付けない
 @quiz_bp.route('/quiz/<int:unit_id>/<int:genre_id>/<int:post_id>')
 @login_required
 def quiz(unit_id, genre_id,post_id):
-    genre = Genre.query.get_or_404(genre_id)
-    unit = Unit.query.get_or_404(unit_id)
-    post= Post.query.get_or_404(post_id)
+    genre = catalog.get_genre(genre_id) or abort(404)
+    unit = catalog.get_unit(unit_id) or abort(404)
+    post = unit.posts.get(post_id) or abort(404)
 
-    all_posts = Post.query.filter_by(unit_id=unit_id).order_by(Post.id.asc()).all()
-    total = len(all_posts)
-    current_number = next((i + 1 for i, p in enumerate(all_posts) if p.id == post.id), 0)
+    # 2問目以降は解答後の URL の attempt を引き継ぐ（本人のその単元の挑戦か確かめる。単元一覧からは quiz.start で始める）
+    # attempt が無ければ、1問目は始めたばかりの未解答の挑戦を使い（無ければ始め）、それ以外は続きの挑戦を使う
+    attempt = get_attempt(request.args.get('attempt', type=int), current_user.id, unit.id)
+    if attempt is None:
+        attempt = open_attempt(current_user.id, unit) if unit.number(post_id) == 1 else \
+            resolve_attempt(None, current_user.id, unit.id)
+    attempt_id = attempt.id
 
-    if current_number == 1:
-        session['start_time'] = datetime.utcnow().isoformat()
-        session['unit_id'] = unit_id
+    # 問題番号は挑戦の出題順で数える（シャッフル・抽出した挑戦ならその順）
+    order = sampler.order(attempt_id, unit)
+    total = order.total
+    current_number = order.number(post_id)
 
-    return render_template('quiz.html', post=post, genre=genre, unit=unit, total=total, current_number=current_number)
+    return render_template('quiz.html', post=post, genre=genre, unit=unit, total=total, current_number=current_number,
+                           attempt_id=attempt_id)
 
+# 出題のしかたを選んで挑戦を始める（シャッフル・抽出・苦手な問題を多めに）
+def start_drawn_attempt(unit, mode, size):
+    post_ids = sampler.draw(unit, mode, size, current_user.id)
+    return start_attempt(current_user.id, unit.id, post_ids, mode)
 
-@quiz_bp.route('/answer/<int:post_id>', methods=['POST'])
+
+# 挑戦の出題順で post_id の次の問題。出題順を決めた後に削除された問題は飛ばす
+def next_in_order(order, unit, post_id):
+    next_post_id = order.next_post_id(post_id)
+    while next_post_id is not None and next_post_id not in unit.posts:
+        next_post_id = order.next_post_id(next_post_id)
+    return next_post_id
+
+
+@quiz_bp.route('/quiz/<int:unit_id>/start', methods=['POST'])
 @login_required
-def answer(post_id):
-    selected = request.form['selected']
-    post = Post.query.get_or_404(post_id)
-    is_correct = (selected == post.answer)
+def start(unit_id):
+    unit = catalog.get_unit(unit_id) or abort(404)
+    mode = request.form.get('mode', 'order')
+    if mode not in MODES or not unit.post_ids:
+        abort(400)
+    attempt = start_drawn_attempt(unit, mode, request.form.get('size', type=int))
+    order = sampler.order(attempt.id, unit)
+    return redirect(url_for('quiz.quiz', unit_id=unit.id, genre_id=unit.genre_id, post_id=order.first_post_id,
+                            attempt=attempt.id))
+
+# 終わっていない挑戦を、まだ答えていない最初の問題から続ける（別のワーカー・端末からでも続けられる）
+@quiz_bp.route('/quiz/<int:unit_id>/resume')
+@login_required
+def resume(unit_id):
+    unit = catalog.get_unit(unit_id) or abort(404)
+    answer_buffer.flush()
+    attempt = resumable_attempts(current_user.id).filter(QuizAttempt.unit_id == unit.id).order_by(
+        QuizAttempt.id.desc()).first()
+    if attempt is None:
+        return redirect(url_for('quiz.unit', genre_id=unit.genre_id))
+
+    wait_for_answers(attempt.id)
+    answered = attempt_answers(attempt.id)
+    order = sampler.order(attempt.id, unit)
+    next_post_id = next((post_id for post_id in order.post_ids if post_id not in answered and post_id in unit.posts),
+                        None)
+    if next_post_id is None:
+        return redirect(url_for('quiz.result', unit_id=unit.id, attempt=attempt.id))
+    return redirect(url_for('quiz.quiz', unit_id=unit.id, genre_id=unit.genre_id, post_id=next_post_id,
+                            attempt=attempt.id))
 
-    # 解答記録
-    record = AnswerRecord(
+
+# 解答記録（ANSWER_BUFFER_ENABLED の場合はまとめて書き込む）。成績・復習キューも同時に更新される
+def record_answer(post, selected, attempt_id=None):
+    is_correct = (selected == post.answer)
+    answer_buffer.add(
         user_id=current_user.id,
         post_id=post.id,
         selected_answer=selected,
-        is_correct=is_correct
+        is_correct=is_correct,
+        answered_at=datetime.now(pytz.timezone('Asia/Tokyo')),
+        attempt_id=attempt_id
     )
+    # まとめて書き込む場合、挑戦の解答は別のワーカーのバッファに残っていることがあるため、
+    # 結果画面で揃うのを待てるよう挑戦ごとの解答数をセッションに持つ
+    if answer_buffer.enabled and attempt_id is not None:
+        pending = session.get('attempt_answers')
+        count = pending[1] + 1 if pending and pending[0] == attempt_id else 1
+        session['attempt_answers'] = [attempt_id, count]
+    return is_correct
 
-    db.session.add(record)
-    db.session.commit()
 
-    # 次の問題（同ジャンルに限定）
-    next_post = Post.query.filter(Post.unit_id == post.unit_id, Post.id > post.id).order_by(Post.id.asc()).first()
+# この挑戦でセッションから送った解答が全て書き込まれるまで待つ（ワーカーをまたいだ解答も結果に含める）
+def wait_for_answers(attempt_id):
+    pending = session.get('attempt_answers')
+    count = pending[1] if pending and pending[0] == attempt_id else 0
+    if not answer_buffer.wait_for(attempt_id, count):
+        current_app.logger.warning('attempt %s: 書き込まれていない解答があるまま集計します', attempt_id)
 
-    if next_post:
-        return redirect(url_for('quiz.quiz', unit_id=post.unit_id, genre_id=post.unit.genre_id, post_id=next_post.id))
+@quiz_bp.route('/answer/<int:post_id>', methods=['POST'])
+@login_required
+def answer(post_id):
+    selected = request.form['selected']
+    unit = catalog.get_unit_for_post(post_id) or abort(404)
+    post = unit.posts[post_id]
+    attempt = resolve_attempt(request.form.get('attempt_id', type=int), current_user.id, unit.id)
+    record_answer(post, selected, attempt.id)
+
+    # 次の問題（挑戦の出題順）
+    next_post_id = next_in_order(sampler.order(attempt.id, unit), unit, post.id)
+
+    if next_post_id:
+        return redirect(url_for('quiz.quiz', unit_id=post.unit_id, genre_id=unit.genre_id, post_id=next_post_id,
+                                attempt=attempt.id))
     else:
-        return redirect(url_for('quiz.result',unit_id=post.unit_id))  # 最後ならマイページなど
+        return redirect(url_for('quiz.result', unit_id=post.unit_id, attempt=attempt.id))  # 最後ならマイページなど
 
 @quiz_bp.route('/result_unit/<int:unit_id>')
 @login_required
 def result(unit_id):
-    unit = Unit.query.get_or_404(unit_id)
-    posts = Post.query.filter_by(unit_id=unit.id).all()
-    post_ids = [p.id for p in posts]
+    unit = catalog.get_unit(unit_id) or abort(404)
+    attempt = get_attempt(request.args.get('attempt', type=int), current_user.id, unit.id) or \
+        latest_attempt(current_user.id, unit.id) or abort(404)
 
-    # 回答記録を取得
-    records = AnswerRecord.query.filter(
-        AnswerRecord.user_id == current_user.id,
-        AnswerRecord.post_id.in_(post_ids)
-    ).order_by(AnswerRecord.answered_at.desc()).limit(len(post_ids)).all()
+    # バッファに残っている解答記録（他のワーカーのものも）が書き込まれてから集計する
+    wait_for_answers(attempt.id)
+
+    # この挑戦の解答（同じ問題に何度か答えた場合は最後の解答）
+    answers = attempt_answers(attempt.id)
+    results = [(unit.posts[post_id], answers[post_id]) for post_id in sampler.order(attempt.id, unit).post_ids
+               if post_id in answers and post_id in unit.posts]
 
     # 正答数
-    correct = sum(1 for r in records if r.is_correct)
-    total = len(records)
+    correct = sum(1 for _, r in results if r.is_correct)
+    total = len(results)
 
-    # 間違えた問題のみ抽出
-    incorrect_records = [r for r in records if not r.is_correct]
+    # 1問も答えていない挑戦は終えずに単元一覧へ戻す（解答数0の解答履歴を作らない）
+    if not results and attempt.finished_at is None:
+        return redirect(url_for('quiz.unit', genre_id=unit.genre_id))
 
-    # 時間計測
-    start_time = session.get('start_time')
-    elapsed = None
+    # 間違えた問題のみ抽出
+    incorrect_records = [{'post': post, 'selected_answer': r.selected_answer} for post, r in results if not r.is_correct]
 
-    if start_time:
-        start = datetime.fromisoformat(start_time)
+    # 結果を初めて出すときに挑戦を終え、解答履歴・成績・ランキングに記録する（再読み込みでは記録しない）
+    if attempt.finished_at is None:
         end = datetime.utcnow()
-        elapsed = datetime.utcnow() - start
-
-        new_session = AnswerSession(
-            user_id=current_user.id,
-            unit_id=unit.id,
-            started_at=start,
-            ended_at=end,
-            correct_count=correct,
-            total_count=total
-        )
-        db.session.add(new_session)
+        if finish_attempt(attempt, end):
+            seconds = (end - attempt.started_at).total_seconds()
+            db.session.add(AnswerSession(
+                user_id=current_user.id,
+                unit_id=unit.id,
+                started_at=attempt.started_at,
+                ended_at=end,
+                correct_count=correct,
+                total_count=total
+            ))
+            record_attempt(current_user.id, unit.id, correct, total, seconds, end)
+            # ランキングには単元の全問題に答えた挑戦だけを載せる（抜き出した挑戦・苦手な問題だけの挑戦は載せない）
+            if total == len(unit.post_ids):
+                leaderboard.record(current_user.id, unit.id, correct, total, seconds, end)
         db.session.commit()
+    elapsed = attempt.finished_at - attempt.started_at
 
-        session.pop('start_time', None)
-        session.pop('unit_id', None)
-
+    rank, players = leaderboard.rank(unit.id, current_user.id)
     return render_template('result.html',
-                        unit=unit, records=records,
-                        total=total, correct=correct,
+                        unit=unit, total=total, correct=correct,
                         incorrect_records=incorrect_records,
-                        elapsed=elapsed)
+                        elapsed=elapsed, rank=rank, players=players)
+
+# 挑戦の全問題を出題順に1回で配信する（正答は含めない）
+def quiz_payload(unit, order):
+    return {
+        'unit': {'id': unit.id, 'name': unit.name, 'genre_id': unit.genre_id},
+        'posts': [
+            {'id': p.id, 'question': p.question, 'choices': [p.select1, p.select2, p.select3, p.select4]}
+            for p in (unit.posts[post_id] for post_id in order.post_ids if post_id in unit.posts)
+        ],
+    }
+
+# まとめて送られた解答を1トランザクションで記録する。1問も答えていなければ 400（解答数0の解答履歴を作らない）
+def submit_all(unit, selections, attempt):
+    now = datetime.now(pytz.timezone('Asia/Tokyo'))
+    end = datetime.utcnow()
+    post_ids = sampler.order(attempt.id, unit).post_ids if attempt is not None else unit.post_ids
+    answered = [(unit.posts[post_id], selections[post_id]) for post_id in post_ids
+                if post_id in unit.posts and selections.get(post_id)]
+    if not answered:
+        abort(400)
+
+    # 既に結果を出した挑戦への再送信は、開始時刻の分からない解答として扱う
+    if attempt is not None and not finish_attempt(attempt, end):
+        attempt = None
+    start = attempt.started_at if attempt is not None else None
+
+    rows = [
+        dict(user_id=current_user.id, post_id=post.id, selected_answer=selected,
+             is_correct=(selected == post.answer), answered_at=now,
+             attempt_id=attempt.id if attempt is not None else None)
+        for post, selected in answered
+    ]
+    if rows:
+        db.session.execute(insert(AnswerRecord), rows)
+        record_answers(rows)
+
+    correct = sum(1 for post, selected in answered if selected == post.answer)
+    db.session.add(AnswerSession(
+        user_id=current_user.id,
+        unit_id=unit.id,
+        started_at=start or end,
+        ended_at=end,
+        correct_count=correct,
+        total_count=len(answered)
+    ))
+    record_attempt(current_user.id, unit.id, correct, len(answered), (end - (start or end)).total_seconds(), end)
+    # 開始時刻が分からない解答は時間が0秒になるためランキングには載せない。全問題に答えていない場合も載せない
+    if start and len(answered) == len(unit.post_ids):
+        leaderboard.record(current_user.id, unit.id, correct, len(answered), (end - start).total_seconds(), end)
+    db.session.commit()
+
+    incorrect = [{'post': post, 'selected_answer': selected} for post, selected in answered if selected != post.answer]
+    return correct, len(answered), incorrect, end - (start or end)
+
+# まとめて解く画面を開いたときに始めた挑戦（id が送られてこなければ、その単元の終わっていない最新の挑戦）
+def bundle_attempt(unit, attempt_id):
+    return get_attempt(attempt_id, current_user.id, unit.id) or \
+        latest_attempt(current_user.id, unit.id, open_only=True)
+
+#まとめて解答する画面（1ページで全問題）
+@quiz_bp.route('/quiz_all/<int:unit_id>', methods=['GET', 'POST'])
+@login_required
+def quiz_all(unit_id):
+    unit = catalog.get_unit(unit_id) or abort(404)
+
+    if request.method == 'POST':
+        selections = {post_id: request.form.get(f'selected_{post_id}') for post_id in unit.post_ids}
+        attempt = bundle_attempt(unit, request.form.get('attempt_id', type=int))
+        correct, total, incorrect_records, elapsed = submit_all(unit, selections, attempt)
+        rank, players = leaderboard.rank(unit.id, current_user.id)
+        return render_template('result.html',
+                            unit=unit, total=total, correct=correct,
+                            incorrect_records=incorrect_records,
+                            elapsed=elapsed, rank=rank, players=players)
+
+    mode = request.args.get('mode', 'order')
+    if mode not in MODES:
+        abort(400)
+    attempt = open_attempt(current_user.id, unit, mode, request.args.get('size', type=int))
+    payload = quiz_payload(unit, sampler.order(attempt.id, unit))
+    return render_template('quiz_all.html', unit=unit, payload=payload, attempt_id=attempt.id)
+
+# JSON版：GETで全問題、POSTで全解答を受け取り結果を返す
+@quiz_bp.route('/api/quiz/<int:unit_id>', methods=['GET', 'POST'])
+@login_required
+def quiz_bundle(unit_id):
+    unit = catalog.get_unit(unit_id) or abort(404)
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            abort(400)
+        answers = data.get('answers')
+        if not isinstance(answers, dict) or not all(isinstance(selected, str) for selected in answers.values()):
+            abort(400)
+        try:
+            selections = {int(post_id): selected for post_id, selected in answers.items()}
+        except ValueError:
+            abort(400)
+        attempt_id = data.get('attempt_id')
+        if attempt_id is not None and (not isinstance(attempt_id, int) or isinstance(attempt_id, bool)):
+            abort(400)
+
+        correct, total, incorrect, elapsed = submit_all(unit, selections, bundle_attempt(unit, attempt_id))
+        rank, players = leaderboard.rank(unit.id, current_user.id)
+        return jsonify({
+            'correct': correct,
+            'total': total,
+            'elapsed_seconds': int(elapsed.total_seconds()),
+            'rank': rank,
+            'players': players,
+            'incorrect': [
+                {'post_id': r['post'].id, 'question': r['post'].question,
+                 'selected': r['selected_answer'], 'answer': r['post'].answer}
+                for r in incorrect
+            ],
+        })
+
+    mode = request.args.get('mode', 'order')
+    if mode not in MODES:
+        abort(400)
+    attempt = open_attempt(current_user.id, unit, mode, request.args.get('size', type=int))
+    payload = quiz_payload(unit, sampler.order(attempt.id, unit))
+    payload['attempt_id'] = attempt.id
+    return jsonify(payload)
+
+# 復習モード：間違えた問題のうち出題時期を過ぎたものを解き直す
+@quiz_bp.route('/review')
+@login_required
+@read_only
+def review():
+    summary = queue_summary(current_user.id)
+    return render_template('review.html', summary=summary)
+
+# 出題する問題は開始時にまとめて決めてセッションに持つ（解答をまとめて書き込む設定でも同じ問題が続かない）
+@quiz_bp.route('/review/start', methods=['POST'])
+@login_required
+def review_start():
+    post_ids = due_post_ids(current_user.id, current_app.config.get('REVIEW_QUIZ_SIZE', 10))
+    if not post_ids:
+        return redirect(url_for('quiz.review'))
+    session['review'] = dict(post_ids=post_ids, results=[])
+    return redirect(url_for('quiz.review_quiz', number=1))
+
+def review_post(number):
+    state = session.get('review')
+    if not state or not 1 <= number <= len(state['post_ids']):
+        return state, None
+    unit = catalog.get_unit_for_post(state['post_ids'][number - 1])
+    return state, unit.posts[state['post_ids'][number - 1]] if unit else None
+
+def next_review_url(state, number):
+    if number < len(state['post_ids']):
+        return url_for('quiz.review_quiz', number=number + 1)
+    return url_for('quiz.review_result')
+
+@quiz_bp.route('/review/<int:number>')
+@login_required
+@read_only
+def review_quiz(number):
+    state, post = review_post(number)
+    if state is None:
+        return redirect(url_for('quiz.review'))
+    if post is None:
+        # 開始後に削除された問題は飛ばす
+        return redirect(next_review_url(state, number))
+    return render_template('review_quiz.html', post=post, number=number, total=len(state['post_ids']))
+
+@quiz_bp.route('/review/<int:number>/answer', methods=['POST'])
+@login_required
+def review_answer(number):
+    state, post = review_post(number)
+    if state is None or post is None:
+        return redirect(url_for('quiz.review'))
+    selected = request.form['selected']
+    is_correct = record_answer(post, selected)
+    state['results'].append([post.id, selected, is_correct])
+    session['review'] = state
+    return redirect(next_review_url(state, number))
+
+@quiz_bp.route('/review/result')
+@login_required
+@read_only
+def review_result():
+    state = session.pop('review', None)
+    if not state:
+        return redirect(url_for('quiz.review'))
+    results = []
+    for post_id, selected, is_correct in state['results']:
+        unit = catalog.get_unit_for_post(post_id)
+        if unit is not None:
+            results.append((unit.posts[post_id], selected, is_correct))
+    return render_template('review_result.html', results=results,
+                           correct=sum(1 for _, _, ok in results if ok), summary=queue_summary(current_user.id))
+
+@quiz_bp.route('/leaderboard/<int:unit_id>')
+@login_required
+@read_only
+def unit_leaderboard(unit_id):
+    unit = catalog.get_unit(unit_id) or abort(404)
+    entries = leaderboard.top(unit.id, current_app.config.get('LEADERBOARD_SIZE', 10))
+    rank, players = leaderboard.rank(unit.id, current_user.id)
+    return render_template('leaderboard.html', unit=unit, entries=entries, rank=rank, players=players)
+
+#マイページ（単元ごとの成績）
+@quiz_bp.route('/mypage')
+@login_required
+@read_only
+def mypage():
+    stats = UserUnitStat.query.options(joinedload(UserUnitStat.unit)).filter_by(
+        user_id=current_user.id).order_by(UserUnitStat.last_attempted_at.desc()).all()
+    return render_template('mypage.html', stats=stats)
 
 @quiz_bp.route('/history')
 @login_required
+@read_only
 def history():
-    sessions = AnswerSession.query.filter_by(user_id=current_user.id).order_by(AnswerSession.started_at.desc()).all()
-    return render_template('history.html', sessions=sessions)
+    page_size = current_app.config.get('HISTORY_PAGE_SIZE', 20)
+    query = AnswerSession.query.options(joinedload(AnswerSession.unit)).filter_by(user_id=current_user.id)
+
+    # (started_at, id) のキーセットでページ送りする
+    before_time = request.args.get('before_time')
+    before_id = request.args.get('before_id', type=int)
+    if before_time and before_id:
+        try:
+            before_time = datetime.fromisoformat(before_time)
+        except ValueError:
+            abort(400)
+        query = query.filter(tuple_(AnswerSession.started_at, AnswerSession.id) < tuple_(before_time, before_id))
+
+    sessions = query.order_by(AnswerSession.started_at.desc(), AnswerSession.id.desc()).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(sessions) > page_size:
+        sessions = sessions[:page_size]
+        last = sessions[-1]
+        next_cursor = dict(before_time=last.started_at.isoformat(), before_id=last.id)
+
+    return render_template('history.html', sessions=sessions, next_cursor=next_cursor,
+                           is_first_page=not before_id)
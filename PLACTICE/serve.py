@@ -0,0 +1,92 @@
+# 本番用の起動スクリプト（gunicorn によるプリフォーク・マルチプロセス）
+#   SECRET_KEY=... DATABASE_URL=... python serve.py quiz
+#   SECRET_KEY=... DATABASE_URL=... python serve.py admin
+# 起動前に flask --app run_admin db upgrade でマイグレーションを適用しておく（スキーマが最新でなければ起動しない）
+# ワーカー数は WEB_CONCURRENCY（既定は CPU コア数 * 2 + 1）、スレッド数は GUNICORN_THREADS
+from gunicorn.app.base import BaseApplication
+from shared.config import env_int, web_concurrency
+import logging
+import os
+import sys
+import time
+
+
+class Server(BaseApplication):
+    def __init__(self, factory, options, import_seconds=0):
+        self.factory = factory
+        self.options = options
+        self.import_seconds = import_seconds
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    # preload_app のためマスターで1回だけ呼ばれる。起動の段階ごとの時間をログに出す
+    def load(self):
+        from shared.startup import format_timings
+
+        app = self.factory()
+        if 'migrate' in app.extensions and not app.config['AUTO_MIGRATE']:
+            from shared.schema import check_schema
+
+            try:
+                check_schema(app)
+            except RuntimeError as e:
+                sys.exit(str(e))
+        timings = dict(imports=self.import_seconds, **app.extensions['startup_timings'])
+        logging.getLogger('gunicorn.error').info('startup: %s', format_timings(timings))
+        return app
+
+
+# fork 前に作られた接続を引き継がないよう破棄してから、ワーカーを温める（レプリカの接続プールも同じ）
+def post_worker_init(worker):
+    from shared.db import db
+    from shared.warmup import warm_up
+
+    app = worker.wsgi
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    timings = warm_up(app)
+    worker.log.info('warm-up: %s', ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in timings.items()))
+
+
+# ワーカー終了時にバッファ中の解答記録を書き込む
+def worker_exit(server, worker):
+    from shared.answer_buffer import answer_buffer
+
+    answer_buffer.close()
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in ('quiz', 'admin'):
+        sys.exit('usage: python serve.py quiz|admin')
+    if not os.environ.get('SECRET_KEY'):
+        sys.exit('SECRET_KEY を設定してください（全ワーカーで共通の値が必要です）')
+
+    start = time.perf_counter()
+    if sys.argv[1] == 'quiz':
+        from quiz_app import quiz_app as factory
+    else:
+        from admin_app import admin_app as factory
+    import_seconds = time.perf_counter() - start
+
+    options = {
+        'bind': f"0.0.0.0:{os.environ.get('PORT', 5000)}",
+        'workers': web_concurrency(),
+        'threads': env_int('GUNICORN_THREADS', 1),
+        'timeout': env_int('GUNICORN_TIMEOUT', 30),
+        'graceful_timeout': env_int('GUNICORN_GRACEFUL_TIMEOUT', 30),
+        'max_requests': env_int('GUNICORN_MAX_REQUESTS', 0),
+        'max_requests_jitter': env_int('GUNICORN_MAX_REQUESTS_JITTER', 0),
+        # アプリの読み込みとスキーマの確認はマスターで1回だけ行う
+        'preload_app': True,
+        'post_worker_init': post_worker_init,
+        'worker_exit': worker_exit,
+    }
+    Server(factory, options, import_seconds).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+from collections import OrderedDict, deque
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import func, case, update
+from sqlalchemy.exc import IntegrityError
+from shared.db import db, upsert
+from shared.models.users import Post, AnswerRecord, PostAnswerStat, AnswerStatWatermark
+import click
+import pytz
+import threading
+import time
+
+
+# 1問分の分析結果。choices は (選択肢, 選ばれた回数, 正答か) の並び
+class QuestionStat:
+    def __init__(self, post, counts):
+        self.post_id = post.id
+        self.answers = sum(n for n, _ in counts.values())
+        self.correct = sum(c for _, c in counts.values())
+        self.choices = []
+        for text in (post.select1, post.select2, post.select3, post.select4):
+            self.choices.append((text, counts.get(text, (0, 0))[0], text == post.answer))
+        # 問題の編集で今の選択肢に無くなった解答
+        self.other = sum(n for text, (n, _) in counts.items()
+                         if text not in (post.select1, post.select2, post.select3, post.select4))
+
+    @property
+    def rate(self):
+        return self.correct / self.answers if self.answers else None
+
+
+# questions は表示する問題（1ページ分）、counts は単元の全問題の集計。単元全体の数字は counts から出す
+class UnitStat:
+    def __init__(self, questions, counts):
+        self.questions = questions
+        totals = [(sum(n for n, _ in c.values()), sum(k for _, k in c.values())) for c in counts.values()]
+        self.answers = sum(n for n, _ in totals)
+        self.correct = sum(k for _, k in totals)
+        rates = [k / n for n, k in totals if n]
+        # 解答のある問題の正答率の平均（解答数の多い問題に引きずられない）
+        self.average_rate = sum(rates) / len(rates) if rates else None
+
+    @property
+    def rate(self):
+        return self.correct / self.answers if self.answers else None
+
+
+# 問題ごとの正答率・選択肢の分布を post_answer_stat に差分で集計し、単元ごとの結果をキャッシュする
+# 集計済みの answer_record.id を watermark に持ち、新しい解答があれば次の確認時に差分だけ足し込む
+class QuestionAnalytics:
+    def __init__(self, maxsize=128, check_interval=10, settle_seconds=2, chunk_size=50000, check_chunk_size=5000):
+        self.maxsize = maxsize
+        self.check_interval = check_interval
+        self.settle_seconds = settle_seconds
+        self.chunk_size = chunk_size
+        # 画面表示（check）で1回に集計する解答の数。残りは次の確認か flask refresh-analytics で集計する
+        self.check_chunk_size = check_chunk_size
+        self._units = OrderedDict()
+        self._seen = deque()
+        self._settled_id = 0
+        self._watermark = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('ANALYTICS_CACHE_SIZE', self.maxsize)
+        self.check_interval = app.config.get('ANALYTICS_CHECK_INTERVAL', self.check_interval)
+        self.settle_seconds = app.config.get('ANALYTICS_SETTLE_SECONDS', self.settle_seconds)
+        self.chunk_size = app.config.get('ANALYTICS_REFRESH_CHUNK', self.chunk_size)
+        self.check_chunk_size = app.config.get('ANALYTICS_CHECK_CHUNK', self.check_chunk_size)
+        app.extensions['analytics'] = self
+
+    def clear(self):
+        with self._lock:
+            self._units.clear()
+            self._watermark = None
+            self._checked_at = None
+
+    # IDの採番順とコミット順はずれることがあるため、settle_seconds 以上前に観測した最大IDまでを集計対象にする
+    def _settled(self, max_id):
+        now = time.monotonic()
+        with self._lock:
+            if self.settle_seconds <= 0:
+                return max_id
+            if not self._seen or self._seen[-1][1] != max_id:
+                self._seen.append((now, max_id))
+            while self._seen and now - self._seen[0][0] >= self.settle_seconds:
+                self._settled_id = max(self._settled_id, self._seen.popleft()[1])
+            return self._settled_id
+
+    # watermark から upto までの解答を GROUP BY で集計して足し込む（max_chunks 回まで）。更新後の watermark を返す
+    def refresh(self, upto=None, chunk_size=None, max_chunks=None):
+        state = db.session.get(AnswerStatWatermark, 1)
+        if state is None:
+            # 通常はマイグレーション（0015）で作られている。create_all で作った DB では、同時に作っても1行になるようにする
+            try:
+                with db.session.begin_nested():
+                    db.session.add(AnswerStatWatermark(id=1, last_record_id=0))
+            except IntegrityError:
+                pass
+            db.session.commit()
+            state = db.session.get(AnswerStatWatermark, 1)
+        lo = state.last_record_id
+        if upto is None:
+            upto = self._settled(db.session.query(func.max(AnswerRecord.id)).scalar() or 0)
+
+        chunks = 0
+        while lo < upto and (max_chunks is None or chunks < max_chunks):
+            chunks += 1
+            hi = min(lo + (chunk_size or self.chunk_size), upto)
+            # 他のワーカーと同じ範囲を二重に集計しないよう、watermark の更新で範囲を確保する
+            claimed = db.session.execute(
+                update(AnswerStatWatermark)
+                .where(AnswerStatWatermark.id == 1, AnswerStatWatermark.last_record_id == lo)
+                .values(last_record_id=hi, updated_at=datetime.now(pytz.timezone('Asia/Tokyo')))
+            ).rowcount
+            if not claimed:
+                db.session.rollback()
+                break
+            self._add_range(lo, hi)
+            db.session.commit()
+            lo = hi
+
+        db.session.expire(state)
+        return db.session.get(AnswerStatWatermark, 1).last_record_id
+
+    def _add_range(self, lo, hi):
+        rows = db.session.query(
+            AnswerRecord.post_id, AnswerRecord.selected_answer,
+            func.count(AnswerRecord.id), func.sum(case((AnswerRecord.is_correct, 1), else_=0)),
+        ).filter(AnswerRecord.id > lo, AnswerRecord.id <= hi).group_by(
+            AnswerRecord.post_id, AnswerRecord.selected_answer).all()
+        if not rows:
+            return
+
+        # 別の範囲を集計している他のワーカーと同じ行に足すことがあるため、件数は upsert で DB 側で足す
+        db.session.execute(upsert(PostAnswerStat, lambda excluded: dict(
+            answers=PostAnswerStat.answers + excluded.answers,
+            correct_count=PostAnswerStat.correct_count + excluded.correct_count,
+        )), [dict(post_id=post_id, selected_answer=selected, answers=answers, correct_count=correct)
+             for post_id, selected, answers, correct in rows])
+
+    # 集計済みの watermark。check_interval ごとに未集計分を足し込む（コミットするため、表示する行はこの後で読む）
+    # リクエストの中で行うため、1回に集計するのは check_chunk_size 件まで（溜まった分は flask refresh-analytics で集計する）
+    def check(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._watermark
+        watermark = self.refresh(chunk_size=self.check_chunk_size, max_chunks=1)
+        with self._lock:
+            self._watermark = watermark
+            self._checked_at = now
+        return watermark
+
+    # 単元の問題ごとの分析結果。posts は表示に使う Post の一覧（選択肢の対応づけに使う）
+    def get_unit(self, unit_id, posts):
+        watermark = self.check()
+        with self._lock:
+            cached = self._units.get(unit_id)
+            if cached is not None and cached[0] == watermark:
+                self._units.move_to_end(unit_id)
+                counts = cached[1]
+            else:
+                counts = None
+
+        if counts is None:
+            counts = {}
+            rows = db.session.query(PostAnswerStat).join(Post, Post.id == PostAnswerStat.post_id).filter(
+                Post.unit_id == unit_id)
+            for s in rows:
+                counts.setdefault(s.post_id, {})[s.selected_answer] = (s.answers, s.correct_count)
+            with self._lock:
+                self._units[unit_id] = (watermark, counts)
+                self._units.move_to_end(unit_id)
+                while len(self._units) > self.maxsize:
+                    self._units.popitem(last=False)
+
+        return UnitStat({post.id: QuestionStat(post, counts.get(post.id, {})) for post in posts}, counts)
+
+
+analytics = QuestionAnalytics()
+
+
+@click.command('refresh-analytics')
+@with_appcontext
+def refresh_analytics_command():
+    """answer_record の未集計分を post_answer_stat に足し込む"""
+    upto = db.session.query(func.max(AnswerRecord.id)).scalar() or 0
+    # 実行時点で書き込み中のトランザクションがコミットされるのを待つ
+    time.sleep(analytics.settle_seconds)
+    click.echo(f'answer_record.id <= {analytics.refresh(upto)} を集計済み')
@@ -0,0 +1,122 @@
+from sqlalchemy import func, insert
+from shared.db import db, mark_written
+from shared.models.users import AnswerRecord
+from shared.progress import record_answers
+import atexit
+import os
+import threading
+import time
+
+
+# 解答記録（と問題ごとの成績）の書き込みをまとめて行うためのバッファ
+# ANSWER_BUFFER_ENABLED が無効の場合は従来通り1件ずつコミットする
+class AnswerBuffer:
+    def __init__(self, max_size=50, interval=1.0):
+        self.enabled = False
+        self.max_size = max_size
+        self.interval = interval
+        self.app = None
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ANSWER_BUFFER_ENABLED', self.enabled)
+        self.max_size = app.config.get('ANSWER_BUFFER_SIZE', self.max_size)
+        self.interval = app.config.get('ANSWER_BUFFER_INTERVAL', self.interval)
+        self.app = app
+        app.extensions['answer_buffer'] = self
+        atexit.register(self.close)
+
+    def add(self, **row):
+        if not self.enabled:
+            db.session.add(AnswerRecord(**row))
+            record_answers([row])
+            db.session.commit()
+            return
+
+        # 書き込みは後でプライマリに届くため、本人の読み取りはしばらくプライマリで行う
+        mark_written()
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.max_size
+        self._ensure_thread()
+        if full:
+            self.flush()
+
+    # 溜まっている解答記録を一括INSERTする。結果画面の前とワーカー終了時に呼ぶ
+    # まとめて書けなければ1件ずつ書き直し、書けない解答（待つ間に問題が削除された等）はログに残して捨てる
+    # （バッファに戻すと、その1件のせいで後の解答も全て書けなくなる）
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows or self.app is None:
+                return 0
+            with self.app.app_context():
+                try:
+                    self._write(rows)
+                    return len(rows)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.warning('answer buffer: %d 件をまとめて書けないため1件ずつ書き込みます', len(rows))
+                stored = 0
+                for row in rows:
+                    try:
+                        self._write([row])
+                        stored += 1
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('answer buffer: 解答記録を書き込めないため破棄しました %r', row)
+                return stored
+
+    def _write(self, rows):
+        db.session.execute(insert(AnswerRecord), rows)
+        record_answers(rows)
+        db.session.commit()
+
+    # 挑戦の解答が count 件書き込まれるまで待つ（結果画面・続きから解く前に呼ぶ）
+    # 他のワーカーのバッファに残っている解答も interval 以内に書き込まれるため、待つのは長くても interval の2倍
+    def wait_for(self, attempt_id, count):
+        self.flush()
+        if not self.enabled or not count:
+            return True
+        deadline = time.monotonic() + self.interval * 2
+        while True:
+            stored = db.session.query(func.count(AnswerRecord.id)).filter(
+                AnswerRecord.attempt_id == attempt_id).scalar()
+            # 読み取りのトランザクションを閉じ、次の読み取りで他のワーカーのコミットが見えるようにする
+            db.session.rollback()
+            if stored >= count or time.monotonic() >= deadline:
+                return stored >= count
+            time.sleep(0.05)
+
+    def close(self):
+        self._wakeup.set()
+        self.flush()
+
+    # fork 後のワーカーでも動くよう、プロセスごとにフラッシュ用スレッドを起動する
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._wakeup.clear()
+            self._thread = threading.Thread(target=self._run, name='answer-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                if self.app is not None:
+                    self.app.logger.exception('answer buffer flush failed')
+
+
+answer_buffer = AnswerBuffer()
@@ -0,0 +1,190 @@
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+from datetime import datetime, timezone
+from shared.startup import BASE_DIR
+import click
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(BASE_DIR, 'shared', 'static')
+# 圧縮して小さくなる種類だけ .gz / .br を作る（画像やフォントはそのまま）
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.html')
+# 置き換えの候補に入れる Content-Encoding（良いものから順に）
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+assets_bp = Blueprint('assets', __name__)
+
+
+def fingerprint(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def hashed_name(filename, digest):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+# {static からの相対パス: 内容のハッシュ}
+def fingerprints(static_dir):
+    digests = {}
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            source = os.path.join(root, name)
+            digests[os.path.relpath(source, static_dir).replace(os.sep, '/')] = fingerprint(source)
+    return digests
+
+
+# static の各ファイルを内容のハッシュ入りの名前で書き出し、gzip / brotli で圧縮したものも並べる
+# 出力先に同じ名前のファイルがあれば中身も同じなので書き直さない。{元の名前: ハッシュ入りの名前} を返す
+def build_assets(static_dir, output_dir):
+    manifest = {}
+    for filename, digest in sorted(fingerprints(static_dir).items()):
+        target = manifest[filename] = hashed_name(filename, digest)
+        path = os.path.join(output_dir, target)
+        if os.path.exists(path):
+            continue
+        with open(os.path.join(static_dir, filename), 'rb') as f:
+            data = f.read()
+        if filename.endswith(COMPRESSIBLE):
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                _write(path + '.gz', compressed)
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    _write(path + '.br', compressed)
+        # 元のファイルは最後に置く（途中で止まっても、次の起動でまた作られる）
+        _write(path, data)
+    return manifest
+
+
+# 静的ファイルは /assets/<ハッシュ入りの名前> で配信し、内容が変われば URL も変わるため長期間キャッシュさせる
+# HTML のレスポンスは送る前に圧縮する（Accept-Encoding に合わせて brotli か gzip）
+class AssetPipeline:
+    def __init__(self, max_age=365 * 24 * 3600, compress_min_size=500, compress_html=True):
+        self.max_age = max_age
+        self.compress_min_size = compress_min_size
+        self.compress_html = compress_html
+        self.output_dir = None
+        self.manifest = {}
+        self.targets = set()
+        self.digests = {}
+        self.build_id = None
+        self.built_at = None
+
+    def init_app(self, app):
+        self.max_age = app.config.get('ASSET_MAX_AGE', self.max_age)
+        self.compress_min_size = app.config.get('COMPRESS_MIN_SIZE', self.compress_min_size)
+        self.compress_html = app.config.get('COMPRESS_HTML', self.compress_html)
+        self.output_dir = app.config.get('ASSETS_DIR') or os.path.join(BASE_DIR, 'instance', 'assets')
+        # build-assets（イメージのビルド時）で作っていなければここで作る。書き込めなければ static から ?v= 付きで配信する
+        try:
+            self.manifest = build_assets(app.static_folder, self.output_dir)
+        except OSError:
+            app.logger.warning('assets: %s に書き込めないため static から配信します', self.output_dir)
+            self.manifest = {}
+            self.digests = fingerprints(app.static_folder)
+        self.targets = set(self.manifest.values())
+        self.build_id, self.built_at = self._build(app)
+        app.extensions['assets'] = self
+        app.jinja_env.globals['asset_url'] = self.url
+        app.after_request(self._compress)
+
+    # デプロイの版。BUILD_ID（無ければ RENDER_GIT_COMMIT）と、静的ファイル・テンプレートの内容から作る
+    # ページの ETag / Last-Modified に含め、デプロイ後に古いハッシュの URL を含む HTML が 304 で使われ続けないようにする
+    def _build(self, app):
+        dirs = [app.static_folder] + [path for loader in getattr(app.jinja_loader, 'loaders', [app.jinja_loader])
+                                      for path in getattr(loader, 'searchpath', [])]
+        parts = [app.config.get('BUILD_ID') or '']
+        mtime = 0
+        for directory in dirs:
+            for name, digest in sorted(fingerprints(directory).items()):
+                path = os.path.join(directory, name)
+                parts.append(f'{os.path.relpath(path, BASE_DIR)}={digest}')
+                mtime = max(mtime, os.path.getmtime(path))
+        built_at = datetime.fromtimestamp(mtime, timezone.utc) if mtime else None
+        return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()[:12], built_at
+
+    # テンプレートで url_for('static', filename=...) の代わりに使う
+    def url(self, filename):
+        target = self.manifest.get(filename)
+        if target is not None:
+            return url_for('assets.asset', filename=target)
+        return url_for('static', filename=filename, v=self.digests.get(filename))
+
+    def _compress(self, response):
+        if (not self.compress_html or response.status_code != 200 or response.mimetype != 'text/html'
+                or response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < self.compress_min_size:
+            return response
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            response.set_data(brotli.compress(data, quality=4))
+            response.content_encoding = 'br'
+        elif accepted['gzip']:
+            response.set_data(gzip.compress(data, compresslevel=6))
+            response.content_encoding = 'gzip'
+        else:
+            return response
+        # 圧縮後は元の表現とバイト列が違うため、ETag は弱いものにする（If-None-Match は弱い比較で照合する）
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+
+assets = AssetPipeline()
+
+
+@assets_bp.route('/assets/<path:filename>')
+def asset(filename):
+    pipeline = current_app.extensions['assets']
+    if filename not in pipeline.targets:
+        abort(404)
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if accepted[encoding] and os.path.exists(os.path.join(pipeline.output_dir, filename + suffix)):
+            response = send_from_directory(pipeline.output_dir, filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0], max_age=pipeline.max_age)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(pipeline.output_dir, filename, max_age=pipeline.max_age)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@click.command('build-assets')
+@click.option('--clean', is_flag=True, help='出力先を空にしてから作る（古いハッシュのファイルを消す）')
+@with_appcontext
+def build_assets_command(clean):
+    """静的ファイルをハッシュ入りの名前で書き出し、gzip / brotli で圧縮する（イメージのビルド時に実行する）"""
+    pipeline = current_app.extensions['assets']
+    if clean and os.path.isdir(pipeline.output_dir):
+        shutil.rmtree(pipeline.output_dir)
+    pipeline.manifest = build_assets(current_app.static_folder, pipeline.output_dir)
+    for filename, target in sorted(pipeline.manifest.items()):
+        click.echo(f'{filename} -> {target}')
+    if brotli is None:
+        click.echo('brotli パッケージが無いため .br は作りませんでした')
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from shared.db import db
+from shared.models.users import QuizAttempt, AnswerRecord
+
+
+# post_ids を渡すと、その順で出題する挑戦にする（shared.sampling で抜き出した問題）
+def start_attempt(user_id, unit_id, post_ids=None, mode='order'):
+    from shared.sampling import encode_order, sampler
+
+    attempt = QuizAttempt(user_id=user_id, unit_id=unit_id, started_at=datetime.utcnow(), mode=mode,
+                          post_order=encode_order(post_ids) if post_ids is not None else None)
+    db.session.add(attempt)
+    db.session.commit()
+    if post_ids is not None:
+        sampler.remember(attempt.id, post_ids)
+    return attempt
+
+
+# 本人のその単元の挑戦だけを返す（URL やフォームで受け取った id を確かめる）
+def get_attempt(attempt_id, user_id, unit_id):
+    if not attempt_id:
+        return None
+    attempt = db.session.get(QuizAttempt, attempt_id)
+    if attempt is None or attempt.user_id != user_id or attempt.unit_id != unit_id:
+        return None
+    return attempt
+
+
+# ユーザー・単元の最新の挑戦（ix_quiz_attempt_user_unit で引く）。open_only なら終わっていないものだけ
+def latest_attempt(user_id, unit_id, open_only=False):
+    query = QuizAttempt.query.filter(QuizAttempt.user_id == user_id, QuizAttempt.unit_id == unit_id)
+    if open_only:
+        query = query.filter(QuizAttempt.finished_at.is_(None))
+    return query.order_by(QuizAttempt.id.desc()).first()
+
+
+# 画面を開いたとき（再読み込みを含む）に使う挑戦。開くたびに quiz_attempt を増やさないよう、同じ出題のしかた・問題数で
+# QUIZ_ATTEMPT_REUSE_SECONDS 以内に始めた、まだ1問も答えていない挑戦があればそれを使い、無ければ問題を抜き出して始める
+# 答えた挑戦や古い挑戦は使わない（開始時刻・以前の解答を持ち込まない。続きから解くのは resume だけ）
+def open_attempt(user_id, unit, mode='order', size=None):
+    from shared.sampling import sampler
+
+    attempt = latest_attempt(user_id, unit.id, open_only=True)
+    max_age = timedelta(seconds=current_app.config.get('QUIZ_ATTEMPT_REUSE_SECONDS', 600))
+    if (attempt is not None and attempt.mode == mode and datetime.utcnow() - attempt.started_at < max_age
+            and not has_answers(attempt.id)
+            and (mode == 'order' or sampler.order(attempt.id, unit).total == sampler.size(unit, mode, size))):
+        return attempt
+    return start_attempt(user_id, unit.id, sampler.draw(unit, mode, size, user_id), mode)
+
+
+def has_answers(attempt_id):
+    return db.session.query(AnswerRecord.query.filter(AnswerRecord.attempt_id == attempt_id).exists()).scalar()
+
+
+# 途中まで答えて終わっていない挑戦（続きから解ける挑戦）
+def resumable_attempts(user_id):
+    return QuizAttempt.query.filter(
+        QuizAttempt.user_id == user_id, QuizAttempt.finished_at.is_(None),
+        AnswerRecord.query.filter(AnswerRecord.attempt_id == QuizAttempt.id).exists())
+
+
+# 受け取った id の挑戦が使えなければ、続きの挑戦か新しい挑戦を使う
+def resolve_attempt(attempt_id, user_id, unit_id):
+    attempt = get_attempt(attempt_id, user_id, unit_id)
+    if attempt is not None and attempt.finished_at is None:
+        return attempt
+    return latest_attempt(user_id, unit_id, open_only=True) or start_attempt(user_id, unit_id)
+
+
+# 挑戦を終える。複数のワーカー・タブから同時に呼ばれても、終えられるのは1回だけ（終えられたら True）
+# コミットは呼び出し側で行う
+def finish_attempt(attempt, finished_at):
+    finished = db.session.execute(
+        update(QuizAttempt)
+        .where(QuizAttempt.id == attempt.id, QuizAttempt.finished_at.is_(None))
+        .values(finished_at=finished_at)
+    ).rowcount
+    db.session.expire(attempt)
+    return bool(finished)
+
+
+# 挑戦の中の解答を問題ごとに最後の1件にまとめる（ix_answer_record_attempt で引く）
+def attempt_answers(attempt_id):
+    records = AnswerRecord.query.filter(AnswerRecord.attempt_id == attempt_id).order_by(AnswerRecord.id.asc())
+    return {r.post_id: r for r in records}
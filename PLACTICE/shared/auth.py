@@ -1,16 +1,19 @@
-from flask import Blueprint, render_template, request, redirect, url_for, abort
+from flask import Blueprint, render_template, request, redirect, abort
 from flask_login import login_user, logout_user, login_required, LoginManager, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import ServiceUnavailable
 from shared.models.users import User
 from shared.db import db
+from shared.user_cache import user_cache
+from shared.passwords import password_hasher
 from functools import wraps
 
 auth_bp = Blueprint('auth', __name__)
 login_manager = LoginManager()
 
+# id / username / role だけを短時間キャッシュから返す（USER_CACHE_TTL 秒）
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 @auth_bp.route('/signup', methods=['GET','POST'])
 def signup():
@@ -22,7 +25,7 @@ def signup():
         
         role = 'admin' if User.query.count() == 0 else 'player'
 
-        user = User(username=username, password=generate_password_hash(password, method='pbkdf2:sha256'), role=role)
+        user = User(username=username, password=password_hasher.hash(password), role=role)
 
         db.session.add(user)
         db.session.commit()
@@ -39,7 +42,14 @@ def login():
         if user is None:
             return render_template('login.html', name_error='ユーザー名が違います')
         
-        if check_password_hash(user.password, password):
+        if password_hasher.check(user.password, password):
+            # 設定したコストと違うハッシュは、パスワードが分かるこのときに作り直す（混んでいれば次回に回す）
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except ServiceUnavailable:
+                    pass
             login_user(user)
             return redirect('/home')
         else:
@@ -0,0 +1,182 @@
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+import threading
+import time
+import pytz
+from shared.db import db, use_primary
+from shared.models.users import Genre, Unit, Post, CatalogVersion
+
+CachedGenre = namedtuple('CachedGenre', 'id name')
+CachedPost = namedtuple('CachedPost', 'id unit_id question select1 select2 select3 select4 answer')
+
+
+# 問題IDの並び。位置の索引を持ち、問題番号・次の問題を O(1) で引ける
+class PostOrder:
+    def __init__(self, post_ids):
+        self.post_ids = post_ids
+        self.positions = {post_id: i for i, post_id in enumerate(post_ids)}
+
+    @property
+    def total(self):
+        return len(self.post_ids)
+
+    @property
+    def first_post_id(self):
+        return self.post_ids[0] if self.post_ids else None
+
+    # 1始まりの問題番号（見つからなければ0）
+    def number(self, post_id):
+        i = self.positions.get(post_id)
+        return 0 if i is None else i + 1
+
+    def next_post_id(self, post_id):
+        i = self.positions.get(post_id)
+        if i is None or i + 1 >= len(self.post_ids):
+            return None
+        return self.post_ids[i + 1]
+
+
+# 単元ごとのキャッシュ。問題IDの並びと位置の索引を持つ
+class CachedUnit(PostOrder):
+    def __init__(self, unit, genre, posts):
+        super().__init__([p.id for p in posts])
+        self.id = unit.id
+        self.name = unit.name
+        self.genre_id = unit.genre_id
+        self.genre = genre
+        self.posts = {p.id: CachedPost(p.id, p.unit_id, p.question, p.select1, p.select2,
+                                       p.select3, p.select4, p.answer) for p in posts}
+        self.loaded_at = time.monotonic()
+
+
+# 読み込み時にDBから取得するカタログキャッシュ（LRU + TTL）
+# 管理画面の更新で CatalogVersion が上がると、各ワーカーは次の版数確認時に破棄する
+# 版数と内容が食い違わないよう、読み込みはレプリカを使う画面でもプライマリで行う
+class CatalogCache:
+    def __init__(self, maxsize=256, ttl=300, version_check_interval=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._units = OrderedDict()
+        self._post_units = {}
+        self._genres = None
+        self._version = None
+        self._updated_at = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('CATALOG_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('CATALOG_CACHE_TTL', self.ttl)
+        self.version_check_interval = app.config.get('CATALOG_VERSION_CHECK_INTERVAL', self.version_check_interval)
+        app.extensions['catalog'] = self
+
+    def clear(self):
+        with self._lock:
+            self._units.clear()
+            self._post_units.clear()
+            self._genres = None
+            self._checked_at = None
+
+    @property
+    def version(self):
+        self._check_version()
+        return self._version
+
+    # 最後にカタログが更新された日時（Last-Modified に使う）
+    @property
+    def updated_at(self):
+        self._check_version()
+        return self._updated_at
+
+    def get_genres(self):
+        self._check_version()
+        genres = self._genres
+        if genres is None:
+            with use_primary():
+                genres = OrderedDict((g.id, CachedGenre(g.id, g.name))
+                                     for g in Genre.query.order_by(Genre.id.asc()).all())
+            with self._lock:
+                self._genres = genres
+        return list(genres.values())
+
+    def get_genre(self, genre_id):
+        self.get_genres()
+        genres = self._genres or {}
+        return genres.get(genre_id)
+
+    def get_unit(self, unit_id):
+        self._check_version()
+        with self._lock:
+            cached = self._units.get(unit_id)
+            if cached is not None and time.monotonic() - cached.loaded_at < self.ttl:
+                self._units.move_to_end(unit_id)
+                return cached
+
+        with use_primary():
+            unit = Unit.query.get(unit_id)
+            if unit is None:
+                return None
+            posts = Post.query.filter_by(unit_id=unit_id).order_by(Post.id.asc()).all()
+            cached = CachedUnit(unit, CachedGenre(unit.genre.id, unit.genre.name), posts)
+
+        with self._lock:
+            old = self._units.pop(unit_id, None)
+            if old is not None:
+                self._forget_posts(old)
+            self._units[unit_id] = cached
+            for post_id in cached.post_ids:
+                self._post_units[post_id] = unit_id
+            while len(self._units) > self.maxsize:
+                _, evicted = self._units.popitem(last=False)
+                self._forget_posts(evicted)
+        return cached
+
+    # 問題IDから所属単元のキャッシュを引く
+    def get_unit_for_post(self, post_id):
+        self._check_version()
+        unit_id = self._post_units.get(post_id)
+        if unit_id is None:
+            with use_primary():
+                unit_id = db.session.query(Post.unit_id).filter(Post.id == post_id).scalar()
+            if unit_id is None:
+                return None
+        cached = self.get_unit(unit_id)
+        if cached is None or post_id not in cached.posts:
+            return None
+        return cached
+
+    def _forget_posts(self, cached):
+        for post_id in cached.post_ids:
+            if self._post_units.get(post_id) == cached.id:
+                del self._post_units[post_id]
+
+    def _check_version(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.version_check_interval:
+            return
+        with use_primary():
+            row = db.session.query(CatalogVersion.version, CatalogVersion.updated_at).filter(
+                CatalogVersion.id == 1).first()
+        version, updated_at = row if row is not None else (0, None)
+        if version != self._version:
+            self.clear()
+        with self._lock:
+            self._version = version
+            self._updated_at = updated_at
+            self._checked_at = now
+
+
+catalog = CatalogCache()
+
+
+# 管理画面でカタログを書き換えたときに呼ぶ。呼び出し側のコミットで版数が確定する
+def bump_catalog_version():
+    row = db.session.get(CatalogVersion, 1)
+    if row is None:
+        row = CatalogVersion(id=1, version=0)
+        db.session.add(row)
+        db.session.flush()
+    row.version = CatalogVersion.version + 1
+    row.updated_at = datetime.now(pytz.timezone('Asia/Tokyo'))
+    catalog.clear()
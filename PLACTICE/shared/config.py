@@ -0,0 +1,98 @@
+import multiprocessing
+import os
+
+
+def env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value in (None, ''):
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+# gunicorn のワーカー数（serve.py と同じ既定値）
+def web_concurrency():
+    return env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+
+
+# 接続プールの設定（SQLite のファイルDB以外で pool_size / max_overflow を使う）
+def engine_options(database_url):
+    options = {
+        'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True),
+        'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+    }
+    if database_url and not database_url.startswith('sqlite'):
+        options.update(
+            pool_size=env_int('DB_POOL_SIZE', 5),
+            max_overflow=env_int('DB_MAX_OVERFLOW', 10),
+            pool_timeout=env_int('DB_POOL_TIMEOUT', 30),
+        )
+    return options
+
+
+# 両アプリ共通の設定を環境変数から読み込む
+# SECRET_KEY は全ワーカーで共通にしないとセッション（session['review'] など）が壊れる
+def load_config(app):
+    secret_key = os.environ.get('SECRET_KEY')
+    app.config['SECRET_KEY'] = secret_key or os.urandom(24)
+    app.config['SECRET_KEY_FROM_ENV'] = bool(secret_key)
+
+    database_url = os.environ.get('DATABASE_URL')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url)
+
+    # 読み取り用レプリカ（quiz_app の @read_only の画面の SELECT を送る）。動作確認は SQLite のファイル2つでもできる
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {'replica': dict(url=replica_url, **engine_options(replica_url))}
+    # レプリカの遅れをどこまで許すか（秒）。書き込んだ本人はこの秒数だけプライマリで読む
+    app.config['DB_REPLICA_LAG_TOLERANCE'] = env_int('DB_REPLICA_LAG_TOLERANCE', 5)
+    app.config['DB_REPLICA_CHECK_INTERVAL'] = env_int('DB_REPLICA_CHECK_INTERVAL', 5)
+
+    # ログイン中ユーザーのキャッシュ（shared.user_cache）。権限変更を全ワーカー・両アプリに即時に反映するため、共有の Redis で持つ
+    # USER_CACHE_LOCAL はプロセスごとに持つ（1プロセスで動かす場合向け。他のプロセスには TTL の間古い権限が残る）
+    app.config['USER_CACHE_REDIS_URL'] = os.environ.get('USER_CACHE_REDIS_URL')
+    app.config['USER_CACHE_LOCAL'] = env_bool('USER_CACHE_LOCAL')
+    app.config['USER_CACHE_TTL'] = env_int('USER_CACHE_TTL', 30)
+
+    # パスワードのハッシュ方式とコスト（変えると、次のログインで作り直す）。同時に計算する数（既定は同時処理数の半分）と、
+    # 空きを待てる数・待つ秒数（超えると 503）
+    app.config['SERVER_CONCURRENCY'] = web_concurrency() * env_int('GUNICORN_THREADS', 1)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD') or 'pbkdf2:sha256:1000000'
+    app.config['PASSWORD_HASH_WORKERS'] = env_int('PASSWORD_HASH_WORKERS', 0) or None
+    app.config['PASSWORD_HASH_QUEUE'] = env_int('PASSWORD_HASH_QUEUE', 32)
+    app.config['PASSWORD_HASH_WAIT'] = env_int('PASSWORD_HASH_WAIT', 10)
+    app.config['PASSWORD_HASH_LOCK_DIR'] = os.environ.get('PASSWORD_HASH_LOCK_DIR') or None
+
+    # ハッシュ入りの静的ファイルの置き場所（shared.assets）。HTML の圧縮は前段のプロキシで行うなら無効にする
+    app.config['ASSETS_DIR'] = os.environ.get('ASSETS_DIR') or None
+    # デプロイの識別子（ページの ETag に含める）。未設定ならテンプレート・静的ファイルの内容から作る
+    app.config['BUILD_ID'] = os.environ.get('BUILD_ID') or os.environ.get('RENDER_GIT_COMMIT') or None
+    app.config['COMPRESS_HTML'] = env_bool('COMPRESS_HTML', True)
+    app.config['ANSWER_BUFFER_ENABLED'] = env_bool('ANSWER_BUFFER_ENABLED')
+
+    # 大きなジャンル・単元・ユーザーの削除を、別スレッドで少しずつ行う（試験時間中の長いロックを避ける）
+    app.config['DELETE_IN_BACKGROUND'] = env_bool('DELETE_IN_BACKGROUND')
+    app.config['DELETE_CHUNK_SIZE'] = env_int('DELETE_CHUNK_SIZE', 1000)
+
+    # 保存期間を過ぎた解答記録の移動先（未設定なら answer_record_archive テーブル）
+    app.config['ANSWER_RETENTION_DAYS'] = env_int('ANSWER_RETENTION_DAYS', 180)
+    app.config['ANSWER_ARCHIVE_CHUNK'] = env_int('ANSWER_ARCHIVE_CHUNK', 20000)
+    app.config['ANSWER_ARCHIVE_DIR'] = os.environ.get('ANSWER_ARCHIVE_DIR') or None
+
+    # ランダム出題（shared.sampling）で抜き出す問題数の既定値と、ワーカーごとに覚えておく挑戦の出題順の数
+    app.config['QUIZ_SAMPLE_SIZE'] = env_int('QUIZ_SAMPLE_SIZE', 20)
+    app.config['QUIZ_ORDER_CACHE_SIZE'] = env_int('QUIZ_ORDER_CACHE_SIZE', 1024)
+    # 問題を開き直したときに、まだ答えていない挑戦を使い回す期間（秒）。これより古い挑戦は使わず新しく始める
+    app.config['QUIZ_ATTEMPT_REUSE_SECONDS'] = env_int('QUIZ_ATTEMPT_REUSE_SECONDS', 600)
+
+    # アプリの作成時にマイグレーションを適用する（開発・テスト用。本番は flask db upgrade で適用する）
+    app.config['AUTO_MIGRATE'] = env_bool('AUTO_MIGRATE')
+
+    # 問題検索（shared.search）で、2文字以下の語だけの検索が1ページで調べる問題の数
+    app.config['SEARCH_SCAN_ROWS'] = env_int('SEARCH_SCAN_ROWS', 5000)
@@ -1,2 +1,144 @@
+from contextlib import contextmanager
+from flask import g, session
 from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+import sqlite3
+import threading
+import time
+
+REPLICA_BIND = 'replica'
+
+
+# 読み取り専用の画面（@read_only）の SELECT だけを読み取り用レプリカ（SQLALCHEMY_BINDS['replica']）に送る
+# 書き込み（flush / INSERT / UPDATE / DELETE）は常にプライマリで、書き込んだ後はそのリクエストの読み取りもプライマリに戻す
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and clause.is_dml):
+                mark_written()
+            elif (g.get('db_read_replica') and isinstance(clause, Select) and clause._for_update_arg is None
+                  and REPLICA_BIND in self._db.engines):
+                return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+# 主キーが重なったら更新する INSERT（INSERT ... ON CONFLICT DO UPDATE。SQLite / Postgres）
+# 同時に最初の行を作ろうとしても IntegrityError にならない。set_ は更新する値の dict か、excluded（挿入しようとした行）から作る関数
+# set_ を省くと主キー以外の列を全て挿入しようとした値にする
+def upsert(model, set_=None):
+    table = model.__table__
+    stmt = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}[db.engine.dialect.name](table)
+    if set_ is None:
+        set_ = {column.name: stmt.excluded[column.name] for column in table.columns if not column.primary_key}
+    elif callable(set_):
+        set_ = set_(stmt.excluded)
+    return stmt.on_conflict_do_update(index_elements=list(table.primary_key.columns), set_=set_)
+
+
+# SQLite は接続ごとに外部キー制約（ON DELETE CASCADE）を有効にする必要がある
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
+# このリクエストの以降の読み取りをプライマリに戻し、書いた本人の次のリクエストも lag_tolerance 秒はプライマリで読む
+def mark_written():
+    g.db_read_replica = False
+    g.db_written = True
+
+
+# @read_only の画面の中でも、ワーカー全体で共有するキャッシュの読み込みなどはプライマリで行う
+@contextmanager
+def use_primary():
+    replica = g.get('db_read_replica')
+    g.db_read_replica = False
+    try:
+        yield
+    finally:
+        if not g.get('db_written'):
+            g.db_read_replica = replica
+
+
+# レプリカの遅れ（秒）
+def replica_lag(engine):
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            return conn.exec_driver_sql(
+                'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+                'THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END').scalar() or 0
+        # SQLite などは遅れを測れないため、接続できれば 0 とする（2つのファイルでの動作確認用）
+        conn.exec_driver_sql('SELECT 1')
+        return 0
+
+
+# レプリカを使ってよいかを判断する。遅れは check_interval 秒ごとに確認し、取れなければ無限大として扱う
+class ReplicaRouter:
+    def __init__(self, lag_tolerance=5, check_interval=5):
+        self.lag_tolerance = lag_tolerance
+        self.check_interval = check_interval
+        self.app = None
+        self._lag = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.lag_tolerance = app.config.get('DB_REPLICA_LAG_TOLERANCE', self.lag_tolerance)
+        self.check_interval = app.config.get('DB_REPLICA_CHECK_INTERVAL', self.check_interval)
+        self.app = app
+        app.extensions['replica_router'] = self
+        app.after_request(self._remember_write)
+
+    @property
+    def enabled(self):
+        return REPLICA_BIND in (self.app.config.get('SQLALCHEMY_BINDS') or {}) if self.app else False
+
+    def lag(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return self._lag
+        try:
+            lag = float(replica_lag(db.engines[REPLICA_BIND]))
+        except Exception:
+            self.app.logger.exception('replica lag check failed')
+            lag = float('inf')
+        with self._lock:
+            self._lag = lag
+            self._checked_at = now
+        return lag
+
+    # 自分の書き込みから lag_tolerance 秒以内、またはレプリカの遅れが lag_tolerance を超えているときはプライマリで読む
+    def use_replica(self):
+        if not self.enabled:
+            return False
+        if session.get('db_primary_until', 0) > time.time():
+            return False
+        return self.lag() <= self.lag_tolerance
+
+    def _remember_write(self, response):
+        if g.get('db_written') and self.enabled:
+            session['db_primary_until'] = time.time() + self.lag_tolerance
+        return response
+
+
+replica_router = ReplicaRouter()
+
+
+# 読み取りだけの画面に付ける。途中で書き込むとそれ以降はプライマリで読む
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_replica = replica_router.use_replica()
+        return view(*args, **kwargs)
+    return wrapper
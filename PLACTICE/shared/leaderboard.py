@@ -0,0 +1,128 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, func
+from shared.db import db, upsert
+from shared.models.users import User, Unit, Post, AnswerSession, LeaderboardEntry
+import click
+import threading
+import time
+
+# 経過時間（ミリ秒）がこの値未満に収まる前提で、正答数と時間を1つの整数にまとめる
+ELAPSED_LIMIT_MS = 2 ** 32 - 1
+
+
+def clamp_elapsed(elapsed_ms):
+    return min(max(elapsed_ms, 0), ELAPSED_LIMIT_MS)
+
+
+def sort_key(correct, elapsed_ms):
+    return -correct * 2 ** 32 + clamp_elapsed(elapsed_ms)
+
+
+# 単元ごとのランキング。上位N件は (unit_id, sort_key) のインデックスを先頭から読むだけで取れる
+# 順位は単元内の sort_key の昇順リストをワーカーごとにキャッシュし、二分探索で求める
+class Leaderboard:
+    def __init__(self, maxsize=64, ttl=10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('LEADERBOARD_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('LEADERBOARD_CACHE_TTL', self.ttl)
+        app.extensions['leaderboard'] = self
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    # 解答を終えたときに呼ぶ。自己ベストを更新した場合だけ書き換える（コミットは呼び出し側で行う）
+    # 同じユーザーの同時の記録でも主キーが衝突しないよう upsert で書き、比較も DB で行う
+    def record(self, user_id, unit_id, correct, total, seconds, achieved_at):
+        elapsed_ms = clamp_elapsed(int(seconds * 1000))
+        values = dict(unit_id=unit_id, user_id=user_id, correct_count=correct, total_count=total,
+                      elapsed_ms=elapsed_ms, sort_key=sort_key(correct, elapsed_ms), achieved_at=achieved_at)
+
+        def better(excluded):
+            improved = excluded.sort_key < LeaderboardEntry.sort_key
+            return {name: case((improved, excluded[name]), else_=getattr(LeaderboardEntry, name))
+                    for name in values if name not in ('unit_id', 'user_id')}
+        db.session.execute(upsert(LeaderboardEntry, better).values(**values))
+        with self._lock:
+            self._keys.pop(unit_id, None)
+
+    def top(self, unit_id, limit=10):
+        return db.session.query(LeaderboardEntry, User.username).join(User, User.id == LeaderboardEntry.user_id).filter(
+            LeaderboardEntry.unit_id == unit_id).order_by(
+            LeaderboardEntry.sort_key.asc(), LeaderboardEntry.achieved_at.asc()).limit(limit).all()
+
+    def _unit_keys(self, unit_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._keys.get(unit_id)
+            if cached is not None and now - cached[0] < self.ttl:
+                self._keys.move_to_end(unit_id)
+                return cached[1]
+
+        keys = [key for (key,) in db.session.query(LeaderboardEntry.sort_key).filter(
+            LeaderboardEntry.unit_id == unit_id).order_by(LeaderboardEntry.sort_key.asc())]
+        with self._lock:
+            self._keys[unit_id] = (now, keys)
+            self._keys.move_to_end(unit_id)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+        return keys
+
+    # (順位, 記録のある人数) を返す。順位は自分より上の記録の数 + 1（同じ記録は同順位）
+    # キャッシュは最大 ttl 秒古いが、自分の記録は DB から読むため順位は自分の最新の記録に対するものになる
+    def rank(self, unit_id, user_id):
+        entry = db.session.get(LeaderboardEntry, (unit_id, user_id))
+        if entry is None:
+            return None, 0
+        keys = self._unit_keys(unit_id)
+        rank = bisect_left(keys, entry.sort_key) + 1
+        return rank, max(len(keys), rank)
+
+
+leaderboard = Leaderboard()
+
+
+# 解答履歴（answer_session）から単元ごとの最高記録を作り直す
+# 今の単元の問題数と同じ数に答えた解答だけを使う（抜き出した挑戦・苦手な問題だけの挑戦は載せない）
+# 表は空にせず、単元ごとに記録を作ってから1トランザクションで置き換える（作り直している間もランキングが空に見えない）
+def rebuild(unit_id=None, echo=print):
+    unit_ids = [unit_id] if unit_id is not None else [
+        uid for (uid,) in db.session.query(Unit.id).order_by(Unit.id.asc())]
+    for uid in unit_ids:
+        best = {}
+        post_count = db.session.query(func.count(Post.id)).filter(Post.unit_id == uid).scalar()
+        sessions = AnswerSession.query.filter(
+            AnswerSession.unit_id == uid, AnswerSession.total_count == post_count).order_by(AnswerSession.id.asc())
+        for s in sessions.yield_per(5000):
+            # 開始時刻の分からないまとめ解き（経過0秒）は記録しない
+            if s.ended_at <= s.started_at:
+                continue
+            elapsed_ms = clamp_elapsed(int((s.ended_at - s.started_at).total_seconds() * 1000))
+            key = sort_key(s.correct_count, elapsed_ms)
+            current = best.get(s.user_id)
+            if current is None or key < current['sort_key']:
+                best[s.user_id] = dict(unit_id=uid, user_id=s.user_id, correct_count=s.correct_count,
+                                       total_count=s.total_count, elapsed_ms=elapsed_ms, sort_key=key,
+                                       achieved_at=s.ended_at)
+        db.session.execute(delete(LeaderboardEntry).where(
+            LeaderboardEntry.unit_id == uid, LeaderboardEntry.user_id.not_in(list(best))))
+        if best:
+            db.session.execute(upsert(LeaderboardEntry), list(best.values()))
+        db.session.commit()
+        echo(f'unit {uid}: {len(best)} entries')
+    leaderboard.clear()
+
+
+@click.command('rebuild-leaderboard')
+@click.option('--unit-id', type=int, help='省略時は全単元')
+@with_appcontext
+def rebuild_leaderboard_command(unit_id):
+    """解答履歴から単元ごとのランキングを作り直す"""
+    rebuild(unit_id, echo=click.echo)
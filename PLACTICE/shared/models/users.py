@@ -16,6 +16,11 @@ class Post(db.Model):
     # genre_id = db.Column(db.Integer, db.ForeignKey('genre.id'), nullable=False)
     unit_id = db.Column(db.Integer, db.ForeignKey('unit.id', ondelete='CASCADE'), nullable=False)
 
+    # 単元内の問題を ID 順に取得するため
+    __table_args__ = (
+        db.Index('ix_post_unit_id_id', 'unit_id', 'id'),
+    )
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(30), unique=True, nullable=False)
@@ -26,41 +31,193 @@ class User(UserMixin, db.Model):
 class AnswerRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False)
 
     selected_answer = db.Column(db.String(100), nullable=False)
     is_correct = db.Column(db.Boolean, nullable=False)
 
     answered_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
 
+    # 単元の通し解答（quiz_attempt）の中の解答なら、その id。復習モードの解答などは NULL
+    attempt_id = db.Column(db.Integer, db.ForeignKey('quiz_attempt.id', ondelete='SET NULL'))
+
     # リレーション（オプション）
-    user = db.relationship('User', backref='answer_records')
-    post = db.relationship('Post', backref='answer_records')
+    user = db.relationship('User', backref=db.backref('answer_records', passive_deletes=True))
+    post = db.relationship('Post', backref=db.backref('answer_records', passive_deletes=True))
+
+    # ユーザー・問題ごとの解答を新しい順に取得するため
+    __table_args__ = (
+        db.Index('ix_answer_record_user_post_answered', 'user_id', 'post_id', 'answered_at'),
+        db.Index('ix_answer_record_attempt', 'attempt_id'),
+    )
+
+
+# 単元の1回分の挑戦。1問目を開いたとき（まとめて解く画面では表示したとき）に作り、結果を出すときに終える
+# 日時は answer_session に合わせて UTC で持つ
+class QuizAttempt(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id', ondelete='CASCADE'), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+    # 出題順に並べた問題IDのカンマ区切り（シャッフル・抽出したとき）。NULL なら単元の問題をID順に全て出す
+    post_order = db.deferred(db.Column(db.Text))
+    # 出題のしかた（shared.sampling.MODES）。画面を開き直したときに同じしかたの挑戦を使い回すため。NULL は記録する前の挑戦
+    mode = db.Column(db.String(10))
+
+    # ユーザー・単元ごとの最新の挑戦を引くため
+    __table_args__ = (
+        db.Index('ix_quiz_attempt_user_unit', 'user_id', 'unit_id', 'id'),
+    )
 
 
 class AnswerSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id', ondelete='CASCADE'), nullable=False)
     started_at = db.Column(db.DateTime, nullable=False)
     ended_at = db.Column(db.DateTime, nullable=False)
     correct_count = db.Column(db.Integer, nullable=False)
     total_count = db.Column(db.Integer, nullable=False)
 
-    user = db.relationship('User', backref='answer_sessions')
-    unit = db.relationship('Unit', backref='answer_sessions')
+    user = db.relationship('User', backref=db.backref('answer_sessions', passive_deletes=True))
+    unit = db.relationship('Unit', backref=db.backref('answer_sessions', passive_deletes=True))
+
+    # 履歴画面のキーセットページング (started_at, id) のため
+    __table_args__ = (
+        db.Index('ix_answer_session_user_started', 'user_id', 'started_at', 'id'),
+    )
 
 class Genre(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(15), unique=True, nullable=False)
 
     # posts = db.relationship('Post', backref='genre', lazy=True, cascade='all, delete')
-    units = db.relationship('Unit', backref='genre', lazy=True, cascade='all, delete-orphan')
+    units = db.relationship('Unit', backref='genre', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
 class Unit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
 
-    genre_id = db.Column(db.Integer, db.ForeignKey('genre.id'), nullable=False)
-    posts = db.relationship('Post', backref='unit', cascade='all, delete-orphan', passive_deletes=True, lazy=True)
\ No newline at end of file
+    genre_id = db.Column(db.Integer, db.ForeignKey('genre.id', ondelete='CASCADE'), nullable=False, index=True)
+    posts = db.relationship('Post', backref='unit', cascade='all, delete-orphan', passive_deletes=True, lazy=True)
+
+# カタログ（ジャンル・単元・問題）の更新を複数ワーカー間で検知するための版数
+class CatalogVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
+
+
+# リクエストごとのSQL計測の集計（アプリ・エンドポイント単位）
+class SqlStat(db.Model):
+    app_name = db.Column(db.String(30), primary_key=True)
+    endpoint = db.Column(db.String(100), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    queries = db.Column(db.Integer, nullable=False, default=0)
+    db_ms = db.Column(db.Float, nullable=False, default=0)
+    max_queries = db.Column(db.Integer, nullable=False, default=0)
+    slowest_ms = db.Column(db.Float, nullable=False, default=0)
+    slowest_sql = db.Column(db.Text)
+    n_plus_one = db.Column(db.Integer, nullable=False, default=0)
+    n_plus_one_sql = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
+
+
+# ユーザー・単元ごとの成績（解答のたびに更新する集計）
+class UserUnitStat(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id', ondelete='CASCADE'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    best_correct = db.Column(db.Integer, nullable=False, default=0)
+    best_total = db.Column(db.Integer, nullable=False, default=0)
+    last_correct = db.Column(db.Integer, nullable=False, default=0)
+    last_total = db.Column(db.Integer, nullable=False, default=0)
+    total_seconds = db.Column(db.Integer, nullable=False, default=0)
+    last_attempted_at = db.Column(db.DateTime)
+
+    unit = db.relationship('Unit')
+
+
+# ユーザー・問題ごとの正誤
+class UserPostStat(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    last_correct = db.Column(db.Boolean, nullable=False, default=False)
+    last_answered_at = db.Column(db.DateTime)
+
+
+# 問題・選んだ選択肢ごとの解答数（管理画面の分析用。answer_record から差分で集計する）
+class PostAnswerStat(db.Model):
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    selected_answer = db.Column(db.String(100), primary_key=True)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# post_answer_stat に集計済みの answer_record.id の上限（1行のみ）
+class AnswerStatWatermark(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    last_record_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
+
+
+# 保存期間を過ぎて answer_record から移した解答のユーザー・問題ごとの集計（成績の作り直しに使う）
+class AnswerRollup(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    answers = db.Column(db.Integer, nullable=False, default=0)
+    correct_count = db.Column(db.Integer, nullable=False, default=0)
+    last_correct = db.Column(db.Boolean, nullable=False, default=False)
+    first_answered_at = db.Column(db.DateTime)
+    last_answered_at = db.Column(db.DateTime)
+
+
+# 保存期間を過ぎた answer_record の移動先（列は answer_record と同じで、id もそのまま残す）
+class AnswerRecordArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False)
+    selected_answer = db.Column(db.String(100), nullable=False)
+    is_correct = db.Column(db.Boolean, nullable=False)
+    answered_at = db.Column(db.DateTime)
+    attempt_id = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_answer_record_archive_user', 'user_id'),
+    )
+
+
+# 復習キュー（間違えた問題）。due_at を過ぎたものが出題対象で、正解を重ねると間隔が延び、最後に外れる
+class ReviewItem(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    due_at = db.Column(db.DateTime, nullable=False)
+    streak = db.Column(db.Integer, nullable=False, default=0)
+    lapses = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_review_item_user_due', 'user_id', 'due_at'),
+    )
+
+
+# 単元ごとの各プレイヤーの最高記録。sort_key が小さいほど上位（正答数が多い → 時間が短い）
+class LeaderboardEntry(db.Model):
+    unit_id = db.Column(db.Integer, db.ForeignKey('unit.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    correct_count = db.Column(db.Integer, nullable=False)
+    total_count = db.Column(db.Integer, nullable=False)
+    # ELAPSED_LIMIT_MS（2**32 - 1）まで入るよう BigInteger にする
+    elapsed_ms = db.Column(db.BigInteger, nullable=False)
+    sort_key = db.Column(db.BigInteger, nullable=False)
+    achieved_at = db.Column(db.DateTime, nullable=False)
+
+    user = db.relationship('User')
+
+    __table_args__ = (
+        db.Index('ix_leaderboard_entry_unit_sort', 'unit_id', 'sort_key'),
+    )
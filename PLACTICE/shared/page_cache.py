@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from flask import request, current_app, make_response
+import hashlib
+import pytz
+import threading
+
+
+# DB の DateTime は東京時間のまま（タイムゾーンなし）で保存されている
+def to_http_datetime(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = pytz.timezone('Asia/Tokyo').localize(value)
+    return value.replace(microsecond=0)
+
+
+# デプロイの版（shared.assets の build_id）も含める。静的ファイルやテンプレートが変われば ETag も変わる
+def make_etag(*parts):
+    assets = current_app.extensions.get('assets')
+    build_id = assets.build_id if assets is not None else None
+    return hashlib.sha1(repr((build_id,) + parts).encode('utf-8')).hexdigest()[:20]
+
+
+# ETag / Last-Modified が一致すれば描画せずに 304 を返す。一致しなければ render() の結果を返す
+# ページはユーザーごとに違うため private にし、毎回再検証させる
+def conditional_response(etag, last_modified, render):
+    assets = current_app.extensions.get('assets')
+    last_modified = list(last_modified) + [assets.built_at if assets is not None else None]
+    last_modified = max((to_http_datetime(v) for v in last_modified if v is not None), default=None)
+
+    if request.if_none_match:
+        # HTML を圧縮すると ETag は弱いもの（W/"..."）になるため、弱い比較で照合する
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = bool(since and last_modified and last_modified <= since)
+
+    response = current_app.response_class(status=304) if not_modified else make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+# 描画済みのテンプレート断片（ジャンル・単元一覧など）をカタログの版数ごとにキャッシュする
+# render は Markup（または Markup のリストなど）を返す関数。版数が変わると全て破棄する
+class FragmentCache:
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', self.maxsize)
+        app.extensions['fragment_cache'] = self
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def get(self, key, version, render):
+        with self._lock:
+            if version != self._version:
+                self._items.clear()
+                self._version = version
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+                return value
+
+        value = render()
+        with self._lock:
+            if version == self._version:
+                self._items[key] = value
+                while len(self._items) > self.maxsize:
+                    self._items.popitem(last=False)
+        return value
+
+
+fragment_cache = FragmentCache()
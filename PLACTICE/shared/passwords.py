@@ -0,0 +1,126 @@
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import generate_password_hash, check_password_hash
+from shared.startup import BASE_DIR
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# 全ワーカーで共有する計算枠。枠ごとのファイルに flock をかけて使う
+# ロックはプロセスが落ちれば（タイムアウトで kill された場合も）OS が外すため、枠が失われることはない
+class _FileSlots:
+    def __init__(self, directory, size, prefix='slot'):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f'{prefix}{n}.lock') for n in range(size)]
+
+    def acquire(self):
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return None
+
+    def release(self, fd):
+        os.close(fd)
+
+
+# fcntl の無い環境ではプロセス内だけで数える
+class _ThreadSlots:
+    def __init__(self, size):
+        self._semaphore = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        return True if self._semaphore.acquire(False) else None
+
+    def release(self, token):
+        self._semaphore.release()
+
+
+# パスワードのハッシュ計算（signup / login）を同時に workers 件までに抑える。空きが無ければ queue 件までは最大 wait 秒待ち、
+# 待ち行列もいっぱいか、待っても空かなければ 503（Retry-After）を返す
+# workers の既定はサーバーの同時処理数（WEB_CONCURRENCY * GUNICORN_THREADS）の半分。
+# ログインが集中しても残りのワーカーは空いたままになり、ログイン済みの画面が止まらない
+class PasswordHasher:
+    def __init__(self, method='pbkdf2:sha256:1000000', workers=None, queue=32, wait=10, retry_after=2,
+                 poll_interval=0.02):
+        # 保存済みのハッシュの先頭（'$' より前）と比べるため、反復回数などのコストまで書く
+        self.method = method
+        self.workers = workers
+        self.queue = queue
+        self.wait = wait
+        self.retry_after = retry_after
+        self.poll_interval = poll_interval
+        self._slots = None
+        self._waiting = None
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS') or self.workers or \
+            max(1, app.config.get('SERVER_CONCURRENCY', 2) // 2)
+        self.queue = app.config.get('PASSWORD_HASH_QUEUE', self.queue)
+        self.wait = app.config.get('PASSWORD_HASH_WAIT', self.wait)
+        self.retry_after = app.config.get('PASSWORD_HASH_RETRY_AFTER', self.retry_after)
+        directory = app.config.get('PASSWORD_HASH_LOCK_DIR') or os.path.join(BASE_DIR, 'instance', 'locks', app.name)
+        # 計算枠と、待ち行列の枠（待っている間だけ持つ）
+        if fcntl is not None:
+            try:
+                self._slots = _FileSlots(directory, self.workers)
+                self._waiting = _FileSlots(directory, self.queue, prefix='wait')
+            except OSError:
+                app.logger.warning('passwords: %s に書き込めないためワーカーごとに数えます', directory)
+                self._slots, self._waiting = _ThreadSlots(self.workers), _ThreadSlots(self.queue)
+        else:
+            self._slots, self._waiting = _ThreadSlots(self.workers), _ThreadSlots(self.queue)
+        app.extensions['password_hasher'] = self
+
+    def busy(self):
+        return ServiceUnavailable('ログインが混み合っています。しばらくしてからもう一度お試しください。',
+                                  retry_after=self.retry_after)
+
+    def _run(self, func, *args):
+        if self._slots is None:
+            return func(*args)
+        token = self._slots.acquire()
+        if token is None:
+            token = self._wait_for_slot()
+        try:
+            return func(*args)
+        finally:
+            self._slots.release(token)
+
+    # 待ち行列に入れれば、計算枠が空くまで最大 wait 秒待つ（別のワーカーの枠が空いても分かるよう、短い間隔で確かめる）
+    def _wait_for_slot(self):
+        ticket = self._waiting.acquire() if self.queue else None
+        if ticket is None:
+            raise self.busy()
+        try:
+            deadline = time.monotonic() + self.wait
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                token = self._slots.acquire()
+                if token is not None:
+                    return token
+            raise self.busy()
+        finally:
+            self._waiting.release(ticket)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    # 今の設定と違う方式・コストで保存されたハッシュ
+    def needs_rehash(self, pwhash):
+        return pwhash.split('$', 1)[0] != self.method
+
+
+password_hasher = PasswordHasher()
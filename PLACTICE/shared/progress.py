@@ -0,0 +1,138 @@
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, or_, tuple_
+from shared.db import db, upsert
+from shared.models.users import (User, AnswerRecord, AnswerSession, UserUnitStat, UserPostStat, ReviewItem,
+                                 AnswerRollup)
+from shared.review import update_review_queue, apply_review, as_naive
+import click
+
+
+# 解答記録（AnswerRecord と同じ形の dict）を問題ごとの成績と復習キューに反映する。コミットは呼び出し側で行う
+# 回数は DB 側で足す（upsert）ため、同じ問題への解答が同時に書き込まれても数え漏れ・主キーの重複にならない
+def record_answers(rows):
+    if not rows:
+        return
+    # 1つの文で同じ行を2回更新できないため、同じ問題への解答は1行にまとめる
+    stats = {}
+    for row in sorted(rows, key=lambda r: as_naive(r['answered_at'])):
+        stat = stats.setdefault((row['user_id'], row['post_id']), dict(
+            user_id=row['user_id'], post_id=row['post_id'], attempts=0, correct_count=0))
+        stat['attempts'] += 1
+        stat['correct_count'] += 1 if row['is_correct'] else 0
+        stat['last_correct'] = row['is_correct']
+        stat['last_answered_at'] = row['answered_at']
+
+    def added(excluded):
+        # 後から書き込まれた古い解答で「前回の正誤」を戻さない
+        newer = or_(UserPostStat.last_answered_at.is_(None), excluded.last_answered_at >= UserPostStat.last_answered_at)
+        return dict(
+            attempts=UserPostStat.attempts + excluded.attempts,
+            correct_count=UserPostStat.correct_count + excluded.correct_count,
+            last_correct=case((newer, excluded.last_correct), else_=UserPostStat.last_correct),
+            last_answered_at=case((newer, excluded.last_answered_at), else_=UserPostStat.last_answered_at))
+
+    db.session.execute(upsert(UserPostStat, added), list(stats.values()))
+    update_review_queue(rows)
+
+
+def apply_attempt(stat, correct, total, seconds, ended_at):
+    stat.attempts += 1
+    if total and (not stat.best_total or correct * stat.best_total > stat.best_correct * total):
+        stat.best_correct = correct
+        stat.best_total = total
+    stat.last_correct = correct
+    stat.last_total = total
+    stat.total_seconds += max(0, int(seconds))
+    stat.last_attempted_at = ended_at
+
+
+# 単元の解答が終わったときに呼ぶ（apply_attempt と同じ更新を upsert で行う）。コミットは呼び出し側で行う
+def record_attempt(user_id, unit_id, correct, total, seconds, ended_at):
+    seconds = max(0, int(seconds))
+    values = dict(attempts=UserUnitStat.attempts + 1, last_correct=correct, last_total=total,
+                  total_seconds=UserUnitStat.total_seconds + seconds, last_attempted_at=ended_at)
+    if total:
+        better = or_(UserUnitStat.best_total == 0,
+                     UserUnitStat.best_correct * total < correct * UserUnitStat.best_total)
+        values.update(best_correct=case((better, correct), else_=UserUnitStat.best_correct),
+                      best_total=case((better, total), else_=UserUnitStat.best_total))
+    db.session.execute(upsert(UserUnitStat, values).values(
+        user_id=user_id, unit_id=unit_id, attempts=1, best_correct=correct if total else 0,
+        best_total=total, last_correct=correct, last_total=total, total_seconds=seconds,
+        last_attempted_at=ended_at))
+
+
+# ユーザーIDの範囲 lo〜hi の行を rows に置き換える（rows を upsert し、rows に無い行を削除する）。コミットは呼び出し側で行う
+def replace_rows(model, lo, hi, rows, chunk_size=500):
+    table = model.__table__
+    key_columns = list(table.primary_key.columns)
+    fresh = {tuple(row[column.name] for column in key_columns) for row in rows}
+    stale = [tuple(key) for key in db.session.query(*key_columns).filter(table.c.user_id.between(lo, hi))
+             if tuple(key) not in fresh]
+    for start in range(0, len(stale), chunk_size):
+        db.session.execute(delete(table).where(tuple_(*key_columns).in_(stale[start:start + chunk_size])))
+    if rows:
+        db.session.execute(upsert(model), rows)
+
+
+def as_row(obj):
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+
+# 既存の解答履歴から成績テーブルを作り直す（ユーザーIDの範囲ごとに処理してコミットする）
+# 表は空にせず範囲ごとに1トランザクションで置き換えるため、作り直している間も成績が欠けて見えることはなく、
+# 解答の書き込み（upsert）とも主キーが重ならない
+def backfill(chunk_size=200, echo=print):
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id.asc())]
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        lo, hi = chunk[0], chunk[-1]
+
+        # 保存期間を過ぎて移した解答は answer_rollup の集計から始める
+        # （復習キューは解答の順序が要るため、answer_record に残っている解答だけから作り直す）
+        post_stats = {}
+        for r in AnswerRollup.query.filter(AnswerRollup.user_id.between(lo, hi)).yield_per(5000):
+            post_stats[(r.user_id, r.post_id)] = dict(
+                user_id=r.user_id, post_id=r.post_id, attempts=r.answers, correct_count=r.correct_count,
+                last_correct=r.last_correct, last_answered_at=r.last_answered_at)
+        review_items = {}
+        records = AnswerRecord.query.filter(AnswerRecord.user_id.between(lo, hi)).order_by(
+            AnswerRecord.answered_at.asc(), AnswerRecord.id.asc())
+        for r in records.yield_per(5000):
+            stat = post_stats.setdefault((r.user_id, r.post_id), dict(
+                user_id=r.user_id, post_id=r.post_id, attempts=0, correct_count=0))
+            stat['attempts'] += 1
+            stat['correct_count'] += 1 if r.is_correct else 0
+            stat['last_correct'] = r.is_correct
+            stat['last_answered_at'] = r.answered_at
+            item = apply_review(review_items.get((r.user_id, r.post_id)), r.user_id, r.post_id, r.is_correct, r.answered_at)
+            if item is None:
+                review_items.pop((r.user_id, r.post_id), None)
+            else:
+                review_items[(r.user_id, r.post_id)] = item
+
+        unit_stats = {}
+        sessions = AnswerSession.query.filter(AnswerSession.user_id.between(lo, hi)).order_by(
+            AnswerSession.started_at.asc(), AnswerSession.id.asc())
+        for s in sessions.yield_per(5000):
+            stat = unit_stats.get((s.user_id, s.unit_id))
+            if stat is None:
+                stat = unit_stats[(s.user_id, s.unit_id)] = UserUnitStat(
+                    user_id=s.user_id, unit_id=s.unit_id, attempts=0, best_correct=0, best_total=0,
+                    last_correct=0, last_total=0, total_seconds=0)
+            apply_attempt(stat, s.correct_count, s.total_count, (s.ended_at - s.started_at).total_seconds(), s.ended_at)
+
+        replace_rows(UserPostStat, lo, hi, list(post_stats.values()))
+        replace_rows(UserUnitStat, lo, hi, [as_row(stat) for stat in unit_stats.values()])
+        replace_rows(ReviewItem, lo, hi, [as_row(item) for item in review_items.values()])
+        db.session.commit()
+        echo(f'users {lo}-{hi}: {len(post_stats)} question stats, {len(unit_stats)} unit stats, '
+             f'{len(review_items)} review items')
+
+
+@click.command('backfill-progress')
+@click.option('--chunk-size', default=200, help='1回のコミットで処理するユーザー数')
+@with_appcontext
+def backfill_progress_command(chunk_size):
+    """解答履歴から成績テーブル（user_unit_stat / user_post_stat / review_item）を作り直す"""
+    backfill(chunk_size, echo=click.echo)
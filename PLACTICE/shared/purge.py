@@ -0,0 +1,134 @@
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, delete
+from shared.db import db
+from shared.models.users import (Genre, Unit, Post, User, AnswerRecord, AnswerSession,
+                                 UserUnitStat, UserPostStat, PostAnswerStat, ReviewItem,
+                                 LeaderboardEntry, AnswerRecordArchive, AnswerRollup, QuizAttempt)
+from shared.catalog import bump_catalog_version
+import click
+import threading
+import time
+
+
+# 親の削除は DB の ON DELETE CASCADE で子・孫までまとめて消える（1文で済むが、件数が多いとロックが長くなる）
+# 解答履歴の多いジャンル・単元・ユーザーは、子の行を一定件数ずつ別トランザクションで消してから親を消す
+def delete_chunked(table, condition, chunk_size, pause):
+    deleted = 0
+    while True:
+        ids = db.session.execute(select(table.c.id).where(condition).limit(chunk_size)).scalars().all()
+        if not ids:
+            return deleted
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+# 主キーが id でない集計テーブルはキー列の範囲で消す
+def delete_chunked_by(table, key, condition, chunk_size, pause):
+    while True:
+        keys = db.session.execute(select(key).where(condition).distinct().limit(chunk_size)).scalars().all()
+        if not keys:
+            return
+        db.session.execute(delete(table).where(condition, key.in_(keys)))
+        db.session.commit()
+        if pause:
+            time.sleep(pause)
+
+
+def purge_posts(post_ids_query, chunk_size, pause):
+    record = AnswerRecord.__table__
+    delete_chunked(record, record.c.post_id.in_(post_ids_query), chunk_size, pause)
+    archive = AnswerRecordArchive.__table__
+    delete_chunked(archive, archive.c.post_id.in_(post_ids_query), chunk_size, pause)
+    delete_chunked_by(AnswerRollup.__table__, AnswerRollup.user_id,
+                      AnswerRollup.post_id.in_(post_ids_query), chunk_size, pause)
+    delete_chunked_by(UserPostStat.__table__, UserPostStat.user_id,
+                      UserPostStat.post_id.in_(post_ids_query), chunk_size, pause)
+    delete_chunked_by(PostAnswerStat.__table__, PostAnswerStat.post_id,
+                      PostAnswerStat.post_id.in_(post_ids_query), chunk_size, pause)
+    delete_chunked_by(ReviewItem.__table__, ReviewItem.user_id,
+                      ReviewItem.post_id.in_(post_ids_query), chunk_size, pause)
+
+
+def purge_unit(unit_id, chunk_size=1000, pause=0.1):
+    post_ids = select(Post.id).where(Post.unit_id == unit_id).scalar_subquery()
+    purge_posts(post_ids, chunk_size, pause)
+    delete_chunked(AnswerSession.__table__, AnswerSession.unit_id == unit_id, chunk_size, pause)
+    delete_chunked(QuizAttempt.__table__, QuizAttempt.unit_id == unit_id, chunk_size, pause)
+    delete_chunked_by(UserUnitStat.__table__, UserUnitStat.user_id, UserUnitStat.unit_id == unit_id,
+                      chunk_size, pause)
+    delete_chunked_by(LeaderboardEntry.__table__, LeaderboardEntry.user_id, LeaderboardEntry.unit_id == unit_id,
+                      chunk_size, pause)
+
+    unit = db.session.get(Unit, unit_id)
+    if unit is not None:
+        db.session.delete(unit)
+        bump_catalog_version()
+        db.session.commit()
+
+
+def purge_genre(genre_id, chunk_size=1000, pause=0.1):
+    unit_ids = db.session.execute(select(Unit.id).where(Unit.genre_id == genre_id)).scalars().all()
+    for unit_id in unit_ids:
+        purge_unit(unit_id, chunk_size, pause)
+
+    genre = db.session.get(Genre, genre_id)
+    if genre is not None:
+        db.session.delete(genre)
+        bump_catalog_version()
+        db.session.commit()
+
+
+def purge_user(user_id, chunk_size=1000, pause=0.1):
+    delete_chunked(AnswerRecord.__table__, AnswerRecord.user_id == user_id, chunk_size, pause)
+    delete_chunked(AnswerRecordArchive.__table__, AnswerRecordArchive.user_id == user_id, chunk_size, pause)
+    delete_chunked_by(AnswerRollup.__table__, AnswerRollup.post_id, AnswerRollup.user_id == user_id, chunk_size, pause)
+    delete_chunked(AnswerSession.__table__, AnswerSession.user_id == user_id, chunk_size, pause)
+    delete_chunked(QuizAttempt.__table__, QuizAttempt.user_id == user_id, chunk_size, pause)
+    delete_chunked_by(UserPostStat.__table__, UserPostStat.post_id, UserPostStat.user_id == user_id, chunk_size, pause)
+    delete_chunked_by(UserUnitStat.__table__, UserUnitStat.unit_id, UserUnitStat.user_id == user_id, chunk_size, pause)
+    delete_chunked_by(ReviewItem.__table__, ReviewItem.post_id, ReviewItem.user_id == user_id, chunk_size, pause)
+    delete_chunked_by(LeaderboardEntry.__table__, LeaderboardEntry.unit_id, LeaderboardEntry.user_id == user_id,
+                      chunk_size, pause)
+
+    user = db.session.get(User, user_id)
+    if user is not None:
+        db.session.delete(user)
+        db.session.commit()
+
+
+PURGES = {'genre': purge_genre, 'unit': purge_unit, 'user': purge_user}
+
+
+# DELETE_IN_BACKGROUND が有効なら別スレッドで少しずつ消す。途中で止まっても再実行すれば続きから消せる
+def run_purge(kind, target_id):
+    app = current_app._get_current_object()
+    chunk_size = app.config.get('DELETE_CHUNK_SIZE', 1000)
+    pause = app.config.get('DELETE_CHUNK_PAUSE', 0.1)
+
+    def run():
+        with app.app_context():
+            try:
+                PURGES[kind](target_id, chunk_size, pause)
+            except Exception:
+                app.logger.exception('purge %s %s failed', kind, target_id)
+                db.session.rollback()
+
+    thread = threading.Thread(target=run, name=f'purge-{kind}-{target_id}', daemon=True)
+    thread.start()
+    return thread
+
+
+@click.command('purge')
+@click.argument('kind', type=click.Choice(sorted(PURGES)))
+@click.argument('target_id', type=int)
+@click.option('--chunk-size', default=1000, help='1回のトランザクションで消す行数')
+@click.option('--pause', default=0.1, help='チャンクの間に待つ秒数')
+@with_appcontext
+def purge_command(kind, target_id, chunk_size, pause):
+    """ジャンル・単元・ユーザーを解答履歴ごと少しずつ削除する"""
+    PURGES[kind](target_id, chunk_size, pause)
+    click.echo(f'{kind} {target_id} を削除しました')
@@ -0,0 +1,97 @@
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy import select, func, tuple_
+from shared.db import db
+from shared.search import search_query
+from shared.models.users import (Post, Unit, AnswerRecord, AnswerSession, ReviewItem, LeaderboardEntry,
+                                 QuizAttempt, UserPostStat)
+import click
+import re
+
+
+# 主要画面が発行するクエリの形（IDなどの値はダミー）
+def hot_queries():
+    return [
+        ('quiz.result: 挑戦の解答記録',
+         select(AnswerRecord).where(AnswerRecord.attempt_id == 1).order_by(AnswerRecord.id.asc())),
+        ('quiz.answer: ユーザー・単元の終わっていない最新の挑戦',
+         select(QuizAttempt).where(QuizAttempt.user_id == 1, QuizAttempt.unit_id == 1,
+                                   QuizAttempt.finished_at.is_(None)).order_by(QuizAttempt.id.desc()).limit(1)),
+        ('quiz.start: 単元の問題ごとの前回の正誤（苦手な問題を多めに出す）',
+         select(UserPostStat.post_id, UserPostStat.last_correct).join(Post, Post.id == UserPostStat.post_id)
+         .where(UserPostStat.user_id == 1, Post.unit_id == 1)),
+        ('catalog: 単元内の問題（ID順）',
+         select(Post).where(Post.unit_id == 1).order_by(Post.id.asc())),
+        ('quiz.unit: ジャンル内の単元',
+         select(Unit).where(Unit.genre_id == 1)),
+        ('quiz.unit: 単元ごとの問題数',
+         select(Post.unit_id, func.min(Post.id), func.count(Post.id))
+         .join(Unit, Unit.id == Post.unit_id).where(Unit.genre_id == 1).group_by(Post.unit_id)),
+        ('quiz.history: 解答履歴のページ',
+         select(AnswerSession).where(AnswerSession.user_id == 1,
+                                     tuple_(AnswerSession.started_at, AnswerSession.id) < tuple_(datetime.utcnow(), 1))
+         .order_by(AnswerSession.started_at.desc(), AnswerSession.id.desc()).limit(21)),
+        ('quiz.review: 出題時期を過ぎた復習問題',
+         select(ReviewItem.post_id).where(ReviewItem.user_id == 1, ReviewItem.due_at <= datetime.utcnow())
+         .order_by(ReviewItem.due_at.asc()).limit(10)),
+        ('admin.search: 問題文・選択肢の全文検索',
+         search_query('問題文 選択肢', 0, 51).statement),
+        ('admin.search: 短い語を含む全文検索（短い語は索引で引いた行を LIKE で絞る）',
+         search_query('問題文 ab', 0, 51).statement),
+        ('admin.search: 短い語だけの検索（主キーの範囲を LIKE で絞る）',
+         search_query('ab', 0, 51, 5000).statement),
+        ('quiz.unit_leaderboard: 単元の上位',
+         select(LeaderboardEntry).where(LeaderboardEntry.unit_id == 1)
+         .order_by(LeaderboardEntry.sort_key.asc()).limit(10)),
+    ]
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.construct_params()
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if conn.dialect.name == 'sqlite':
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = conn.exec_driver_sql('EXPLAIN ' + str(compiled), params).fetchall()
+    return [row[0] for row in rows]
+
+
+# 実テーブルの全件走査を含む行を返す
+def full_scans(plan, table_names):
+    found = []
+    for line in plan:
+        m = re.match(r'\s*SCAN (\w+)', line) or re.search(r'Seq Scan on (\w+)', line)
+        if m and m.group(1) in table_names:
+            found.append(line.strip())
+    return found
+
+
+def check_query_plans():
+    table_names = set(db.metadata.tables)
+    with db.engine.connect() as conn:
+        with conn.begin():
+            if conn.dialect.name == 'postgresql':
+                # 小さいテーブルでもインデックスを使えるかを確認するため
+                conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            for name, stmt in hot_queries():
+                plan = explain(conn, stmt)
+                scans = full_scans(plan, table_names)
+                yield name, plan, scans
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """主要クエリが全件走査になっていないか EXPLAIN で確認する"""
+    failed = 0
+    for name, plan, scans in check_query_plans():
+        status = 'NG' if scans else 'OK'
+        click.echo(f'[{status}] {name}')
+        for line in plan:
+            click.echo(f'    {line}')
+        failed += bool(scans)
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select, delete, insert, tuple_
+from shared.db import db
+from shared.models.users import AnswerRecord, AnswerRecordArchive, AnswerRollup, AnswerStatWatermark
+from shared.review import as_naive
+import click
+import csv
+import gzip
+import os
+import pytz
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'post_id', 'selected_answer', 'is_correct', 'answered_at', 'attempt_id')
+
+
+# 移す解答（answer_record の行のリスト）をユーザー・問題ごとの集計（answer_rollup）に足し込む
+def rollup_records(records):
+    totals = {}
+    for r in records:
+        total = totals.get((r.user_id, r.post_id))
+        if total is None:
+            total = totals[(r.user_id, r.post_id)] = dict(
+                user_id=r.user_id, post_id=r.post_id, answers=0, correct_count=0,
+                first_answered_at=r.answered_at, last_answered_at=r.answered_at, last_correct=r.is_correct)
+        total['answers'] += 1
+        total['correct_count'] += 1 if r.is_correct else 0
+        if as_naive(r.answered_at) >= as_naive(total['last_answered_at']):
+            total['last_answered_at'] = r.answered_at
+            total['last_correct'] = r.is_correct
+        if as_naive(r.answered_at) < as_naive(total['first_answered_at']):
+            total['first_answered_at'] = r.answered_at
+
+    keys = list(totals)
+    for i in range(0, len(keys), 500):
+        for stat in AnswerRollup.query.filter(
+                tuple_(AnswerRollup.user_id, AnswerRollup.post_id).in_(keys[i:i + 500])):
+            total = totals.pop((stat.user_id, stat.post_id))
+            stat.answers += total['answers']
+            stat.correct_count += total['correct_count']
+            if as_naive(total['last_answered_at']) >= as_naive(stat.last_answered_at):
+                stat.last_answered_at = total['last_answered_at']
+                stat.last_correct = total['last_correct']
+            if as_naive(total['first_answered_at']) < as_naive(stat.first_answered_at):
+                stat.first_answered_at = total['first_answered_at']
+    if totals:
+        db.session.execute(insert(AnswerRollup), list(totals.values()))
+
+
+# id が lo から hi までの範囲の解答を gzip 圧縮した CSV に書き出す
+def write_archive_file(archive_dir, lo, hi, records):
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'answer_record_{lo:010d}_{hi:010d}.csv.gz')
+    with gzip.open(path + '.tmp', 'wt', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(ARCHIVE_COLUMNS)
+        for r in records:
+            writer.writerow([r.id, r.user_id, r.post_id, r.selected_answer, int(r.is_correct),
+                             r.answered_at.isoformat() if r.answered_at else '', r.attempt_id or ''])
+    os.replace(path + '.tmp', path)
+    return path
+
+
+# cutoff より前の解答を answer_record から移し、ユーザー・問題ごとの集計を answer_rollup に残す
+# 分析（post_answer_stat）に集計済みの id までを主キーの順に chunk_size 件ずつ調べ、1チャンクごとにコミットする
+# id は解答の順に増えるため、cutoff 以後の解答を含むチャンクまで移したら止める（保存期間内の行は読まない）
+# 移した行は answer_record から消えるため、途中で止まっても再実行すれば残りから続く
+# 移動先は archive_dir があれば gzip ファイル（コミット前に書くため、中断すると次回と重複しうる。id で除ける）、
+# 無ければ answer_record_archive
+def archive_answers(cutoff, chunk_size=20000, archive_dir=None, max_chunks=None, echo=print):
+    watermark = db.session.get(AnswerStatWatermark, 1)
+    limit_id = watermark.last_record_id if watermark is not None else 0
+    if not limit_id:
+        current_app.logger.warning('archive-answers: 分析が未集計のため移せる解答がありません')
+        echo('分析が一度も集計されていないため、解答を移せません（先に flask refresh-analytics を実行してください）')
+        return 0
+    cutoff = as_naive(cutoff)
+    cursor = 0
+    moved = 0
+    chunks = 0
+
+    while max_chunks is None or chunks < max_chunks:
+        rows = db.session.execute(
+            select(AnswerRecord.id, AnswerRecord.answered_at)
+            .where(AnswerRecord.id > cursor, AnswerRecord.id <= limit_id)
+            .order_by(AnswerRecord.id.asc()).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        lo, cursor = rows[0].id, rows[-1].id
+        ids = [row.id for row in rows if row.answered_at is not None and as_naive(row.answered_at) < cutoff]
+        if not ids:
+            break
+        reached_cutoff = len(ids) < len(rows)
+
+        table = AnswerRecord.__table__
+        records = []
+        deleted = 0
+        for i in range(0, len(ids), 1000):
+            records += db.session.execute(select(table).where(table.c.id.in_(ids[i:i + 1000]))).all()
+        for i in range(0, len(ids), 1000):
+            deleted += db.session.execute(delete(table).where(table.c.id.in_(ids[i:i + 1000]))).rowcount
+        # 同時に動いている別の実行や削除と重なった場合は、集計を二重にしないようこのチャンクを諦める
+        if deleted != len(records):
+            db.session.rollback()
+            if reached_cutoff:
+                break
+            continue
+
+        path = None
+        try:
+            if archive_dir:
+                path = write_archive_file(archive_dir, lo, cursor, records)
+            else:
+                db.session.execute(insert(AnswerRecordArchive), [
+                    {name: getattr(r, name) for name in ARCHIVE_COLUMNS} for r in records])
+            rollup_records(records)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if path:
+                os.remove(path)
+            raise
+        db.session.expire_all()
+
+        moved += len(records)
+        chunks += 1
+        echo(f'answer_record.id {lo}-{cursor}: {len(records)} 件' + (f' -> {path}' if path else ''))
+        if reached_cutoff:
+            break
+    return moved
+
+
+@click.command('archive-answers')
+@click.option('--days', type=int, help='これより古い解答を移す（省略時は ANSWER_RETENTION_DAYS）')
+@click.option('--chunk-size', type=int, help='1回のコミットで移す件数（省略時は ANSWER_ARCHIVE_CHUNK）')
+@click.option('--archive-dir', help='指定すると answer_record_archive ではなく gzip ファイルに書き出す')
+@click.option('--max-chunks', type=int, help='この回数だけ移して止める')
+@with_appcontext
+def archive_answers_command(days, chunk_size, archive_dir, max_chunks):
+    """保存期間を過ぎた解答記録を集計に畳み、answer_record から移す"""
+    config = current_app.config
+    days = days if days is not None else config.get('ANSWER_RETENTION_DAYS', 180)
+    chunk_size = chunk_size or config.get('ANSWER_ARCHIVE_CHUNK', 20000)
+    archive_dir = archive_dir or config.get('ANSWER_ARCHIVE_DIR')
+    cutoff = datetime.now(pytz.timezone('Asia/Tokyo')) - timedelta(days=days)
+    moved = archive_answers(cutoff, chunk_size, archive_dir, max_chunks, echo=click.echo)
+    click.echo(f'{cutoff:%Y-%m-%d %H:%M} より前の解答 {moved} 件を移しました')
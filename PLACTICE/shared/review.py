@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, case, delete, func, tuple_, update
+from shared.db import db, upsert
+from shared.models.users import ReviewItem
+import pytz
+
+# 正解するたびに次の復習までの日数を延ばす。全て正解し終えたらキューから外す
+REVIEW_INTERVALS = (1, 3, 7, 21)
+
+
+# 1件の解答を復習キューの項目に反映する。item が無く不正解なら作成し、キューから外す場合は None を返す
+# 間違えた問題はすぐに出題対象にし、出題時期を過ぎた問題に正解すると次の間隔へ進める
+def apply_review(item, user_id, post_id, is_correct, answered_at):
+    if not is_correct:
+        if item is None:
+            item = ReviewItem(user_id=user_id, post_id=post_id, streak=0, lapses=0)
+        item.streak = 0
+        item.lapses += 1
+        item.due_at = answered_at
+        item.updated_at = answered_at
+    elif item is not None and as_naive(item.due_at) <= as_naive(answered_at):
+        if item.streak >= len(REVIEW_INTERVALS):
+            return None
+        item.due_at = answered_at + timedelta(days=REVIEW_INTERVALS[item.streak])
+        item.streak += 1
+        item.updated_at = answered_at
+    return item
+
+
+# 解答記録（AnswerRecord と同じ形の dict）を復習キューに反映する。コミットは呼び出し側で行う
+# 読んでから書き戻すと同時の解答で更新が失われるため、apply_review と同じ規則を SQL の条件付き更新で行う
+# 同じ問題への解答が複数あれば解答順に1件ずつの回に分け、回ごとにまとめて実行する
+def update_review_queue(rows):
+    if not rows:
+        return
+    keys = {(row['user_id'], row['post_id']) for row in rows}
+    # 正解は既にキューにある問題にしか影響しないため、キューにある問題だけ更新する
+    queued = {tuple(key) for key in db.session.query(ReviewItem.user_id, ReviewItem.post_id).filter(
+        tuple_(ReviewItem.user_id, ReviewItem.post_id).in_(keys))}
+
+    rounds = []
+    seen = {}
+    for row in sorted(rows, key=lambda r: as_naive(r['answered_at'])):
+        key = (row['user_id'], row['post_id'])
+        n = seen[key] = seen.get(key, -1) + 1
+        if n == len(rounds):
+            rounds.append([])
+        rounds[n].append(row)
+
+    table = ReviewItem.__table__
+    due = (table.c.user_id == bindparam('key_user_id'), table.c.post_id == bindparam('key_post_id'),
+           table.c.due_at <= bindparam('key_answered_at'))
+    for batch in rounds:
+        # 間違えた問題はすぐに出題対象にする（他のリクエストが同時に作っていても1件にまとまる）
+        wrong = [dict(user_id=row['user_id'], post_id=row['post_id'], due_at=row['answered_at'], streak=0, lapses=1,
+                      updated_at=row['answered_at']) for row in batch if not row['is_correct']]
+        if wrong:
+            db.session.execute(upsert(ReviewItem, lambda excluded: dict(
+                streak=0, lapses=ReviewItem.lapses + 1, due_at=excluded.due_at, updated_at=excluded.updated_at)), wrong)
+            queued.update((row['user_id'], row['post_id']) for row in wrong)
+
+        # 出題時期を過ぎた問題に正解すると次の間隔へ進め、全て正解し終えたらキューから外す
+        right = [row for row in batch if row['is_correct'] and (row['user_id'], row['post_id']) in queued]
+        if right:
+            params = [dict(key_user_id=row['user_id'], key_post_id=row['post_id'],
+                           key_answered_at=as_naive(row['answered_at']), updated=row['answered_at'],
+                           **{f'due{n}': row['answered_at'] + timedelta(days=days)
+                              for n, days in enumerate(REVIEW_INTERVALS)})
+                      for row in right]
+            db.session.execute(delete(table).where(*due, table.c.streak >= len(REVIEW_INTERVALS)),
+                               [{k: v for k, v in p.items() if k.startswith('key_')} for p in params])
+            db.session.execute(update(table).where(*due, table.c.streak < len(REVIEW_INTERVALS)).values(
+                due_at=case(*((table.c.streak == n, bindparam(f'due{n}', type_=table.c.due_at.type)) for n in range(len(REVIEW_INTERVALS)))),
+                streak=table.c.streak + 1, updated_at=bindparam('updated', type_=table.c.updated_at.type)), params)
+
+
+# DB から読んだ日時はタイムゾーンなし（東京時間）のため、比較はタイムゾーンを外して行う
+def as_naive(value):
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def due_filter(user_id, now=None):
+    now = now or datetime.now(pytz.timezone('Asia/Tokyo'))
+    return (ReviewItem.user_id == user_id, ReviewItem.due_at <= now)
+
+
+# 出題時期を過ぎた問題を古い順に取り出す（user_id, due_at のインデックスで引く）
+def due_post_ids(user_id, limit):
+    rows = db.session.query(ReviewItem.post_id).filter(*due_filter(user_id)).order_by(
+        ReviewItem.due_at.asc()).limit(limit)
+    return [post_id for (post_id,) in rows]
+
+
+def queue_summary(user_id):
+    total, next_due_at = db.session.query(func.count(ReviewItem.post_id), func.min(ReviewItem.due_at)).filter(
+        ReviewItem.user_id == user_id).one()
+    due = db.session.query(func.count(ReviewItem.post_id)).filter(*due_filter(user_id)).scalar()
+    return dict(total=total, due=due, next_due_at=next_due_at)
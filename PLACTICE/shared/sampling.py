@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from shared.catalog import PostOrder
+from shared.db import db, use_primary
+from shared.models.users import Post, QuizAttempt, UserPostStat
+import random
+import threading
+
+# 出題のしかた。order は単元の問題をID順に全て（従来通り）
+MODES = ('order', 'shuffle', 'sample', 'weak')
+
+
+def encode_order(post_ids):
+    return ','.join(str(post_id) for post_id in post_ids)
+
+
+def decode_order(value):
+    return [int(post_id) for post_id in value.split(',')] if value else []
+
+
+# 重みに比例して各層から取る数を決める。足りない層の分は他の層に回す
+# 問題のある層の重みが全て0なら、層の大きさに比例させる（全問題から均等に抜き出すのと同じ）
+def allocate(sizes, weights, size):
+    if not any(n > 0 and w > 0 for n, w in zip(sizes, weights)):
+        weights = sizes
+    alloc = [0] * len(sizes)
+    left = min(size, sum(n for n, w in zip(sizes, weights) if w > 0))
+    while left > 0:
+        active = [i for i in range(len(sizes)) if weights[i] > 0 and alloc[i] < sizes[i]]
+        total = sum(weights[i] for i in active)
+        share = left
+        for i in sorted(active, key=lambda i: -weights[i]):
+            take = min(sizes[i] - alloc[i], max(1, int(share * weights[i] / total)), left)
+            alloc[i] += take
+            left -= take
+            if left == 0:
+                break
+    return alloc
+
+
+# 単元の問題IDの配列（カタログにキャッシュ済み）から抜き出す。ORDER BY RANDOM() で全件を並べ替えない
+# 抜き出した順序は挑戦（quiz_attempt.post_order）に残し、ワーカーごとにもキャッシュする
+class QuestionSampler:
+    def __init__(self, default_size=20, weights=None, cache_size=1024):
+        self.default_size = default_size
+        # weak: 前回間違えた問題・未解答の問題・前回正解した問題の比
+        self.weights = weights or {'wrong': 3, 'unseen': 2, 'correct': 1}
+        self.cache_size = cache_size
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.default_size = app.config.get('QUIZ_SAMPLE_SIZE', self.default_size)
+        self.weights = app.config.get('QUIZ_SAMPLE_WEIGHTS', self.weights)
+        self.cache_size = app.config.get('QUIZ_ORDER_CACHE_SIZE', self.cache_size)
+        app.extensions['question_sampler'] = self
+
+    def clear(self):
+        with self._lock:
+            self._orders.clear()
+
+    # 出題する問題の数（shuffle・order は単元の全問題）
+    def size(self, unit, mode, size=None):
+        if mode in ('order', 'shuffle'):
+            return len(unit.post_ids)
+        return min(max(1, size or self.default_size), len(unit.post_ids))
+
+    # 出題する問題IDを順に返す。order なら None（単元の並びをそのまま使う）
+    def draw(self, unit, mode, size=None, user_id=None, rng=None):
+        rng = rng or random.Random()
+        post_ids = unit.post_ids
+        size = self.size(unit, mode, size)
+        if mode == 'shuffle':
+            return rng.sample(post_ids, len(post_ids))
+        if mode == 'sample':
+            return rng.sample(post_ids, size)
+        if mode == 'weak':
+            strata = self.strata(unit, user_id)
+            names = list(strata)
+            alloc = allocate([len(strata[name]) for name in names],
+                             [self.weights.get(name, 0) for name in names], size)
+            drawn = []
+            for name, n in zip(names, alloc):
+                drawn += rng.sample(strata[name], n)
+            rng.shuffle(drawn)
+            return drawn
+        return None
+
+    # 単元の問題を前回の正誤で分ける（user_post_stat を主キーの user_id から引く）
+    def strata(self, unit, user_id):
+        last = dict(db.session.query(UserPostStat.post_id, UserPostStat.last_correct).join(
+            Post, Post.id == UserPostStat.post_id).filter(
+            UserPostStat.user_id == user_id, Post.unit_id == unit.id))
+        strata = {'wrong': [], 'unseen': [], 'correct': []}
+        for post_id in unit.post_ids:
+            if post_id not in last:
+                strata['unseen'].append(post_id)
+            else:
+                strata['correct' if last[post_id] else 'wrong'].append(post_id)
+        return strata
+
+    def remember(self, attempt_id, post_ids):
+        order = PostOrder(post_ids)
+        with self._lock:
+            self._orders[attempt_id] = order
+            self._orders.move_to_end(attempt_id)
+            while len(self._orders) > self.cache_size:
+                self._orders.popitem(last=False)
+        return order
+
+    # 挑戦の出題順。抜き出していない挑戦なら単元（CachedUnit）をそのまま返す
+    def order(self, attempt_id, unit):
+        if attempt_id is None:
+            return unit
+        with self._lock:
+            order = self._orders.get(attempt_id)
+            if order is not None:
+                self._orders.move_to_end(attempt_id)
+                return order
+        # 作ったばかりの挑戦がレプリカにまだ無いことがあるため、プライマリから読む
+        with use_primary():
+            value = db.session.query(QuizAttempt.post_order).filter(QuizAttempt.id == attempt_id).scalar()
+        if value is None:
+            return unit
+        return self.remember(attempt_id, decode_order(value))
+
+
+sampler = QuestionSampler()
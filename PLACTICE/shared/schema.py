@@ -0,0 +1,45 @@
+from alembic.script import ScriptDirectory
+from flask_migrate import upgrade, stamp
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from shared.db import db
+
+# migrations 導入前（db.create_all() 時代）のテーブル構成に相当するリビジョン
+BASELINE_REVISION = '0001'
+
+
+def current_revision():
+    try:
+        return db.session.execute(text('SELECT version_num FROM alembic_version')).scalar()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return None
+    finally:
+        db.session.remove()
+
+
+def head_revision(app):
+    config = app.extensions['migrate'].migrate.get_config()
+    return ScriptDirectory.from_config(config).get_current_head()
+
+
+# マイグレーションを適用する（AUTO_MIGRATE が有効な場合だけ、アプリを作るときに呼ぶ）
+# 記録済みのリビジョンが最新ならテーブル構成の確認もマイグレーションの読み込みもしない
+# create_all で作られた既存DBは初期リビジョンとして記録してから残りを適用する
+def ensure_schema(app):
+    with app.app_context():
+        if current_revision() == head_revision(app):
+            return
+        tables = inspect(db.engine).get_table_names()
+        if 'alembic_version' not in tables and 'user' in tables:
+            stamp(revision=BASELINE_REVISION)
+        upgrade()
+
+
+# 本番の起動時（serve.py）の確認。スキーマが最新でなければ起動しない（マイグレーションは flask db upgrade で行う）
+def check_schema(app):
+    with app.app_context():
+        current, head = current_revision(), head_revision(app)
+    if current != head:
+        raise RuntimeError(f'データベースのスキーマ（{current}）が最新（{head}）ではありません。'
+                           f'flask --app run_admin db upgrade を実行してから起動してください')
@@ -0,0 +1,132 @@
+from flask.cli import with_appcontext
+from sqlalchemy import or_, literal_column, table, column
+from sqlalchemy.orm import joinedload
+from shared.db import db
+from shared.models.users import Post, Unit
+import click
+
+# 問題文・選択肢の全文検索（語の部分一致。日本語は分かち書きしないため、どちらの DB も3文字ずつの trigram で引く）
+# SQLite: FTS5（trigram）の外部コンテンツテーブル post_fts。post へのトリガーで追加・更新・削除に追従する
+#   batch_alter_table で post を作り直すとトリガーが消える。migrations/env.py がマイグレーションの後に
+#   repair_search_index で作り直すが、post を作り直すマイグレーションには念のためその旨を書いておく
+# Postgres: pg_trgm の GIN 式インデックス ix_post_search_trgm（gin_trgm_ops）を ILIKE で引く。式インデックスのため更新は自動で反映される
+SEARCH_COLUMNS = ('question', 'select1', 'select2', 'select3', 'select4')
+FTS_TABLE = 'post_fts'
+FTS_TRIGGERS = [f'{FTS_TABLE}_insert', f'{FTS_TABLE}_delete', f'{FTS_TABLE}_update']
+POSTGRES_INDEX = 'ix_post_search_trgm'
+# trigram で引ける最短の語。これより短い語だけの検索は索引を使えないため、1ページで調べる問題の数を scan_rows 件までにする
+TRIGRAM_LENGTH = 3
+
+
+def _columns(prefix=''):
+    return ', '.join(prefix + name for name in SEARCH_COLUMNS)
+
+
+SQLITE_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_columns()}, "
+    f"content='post', content_rowid='id', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns('new.')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) VALUES ('delete', old.id, {_columns('old.')}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF {_columns()} ON post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) VALUES ('delete', old.id, {_columns('old.')}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns('new.')}); END",
+]
+SQLITE_DROP = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+# 検索条件にもこの式をそのまま使う（式が一致しないとインデックスが使われない）。列は全て NOT NULL
+POSTGRES_DOCUMENT = '(' + " || ' ' || ".join(f'post.{name}' for name in SEARCH_COLUMNS) + ')'
+POSTGRES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON post USING gin ({POSTGRES_DOCUMENT} gin_trgm_ops)',
+]
+# ix_post_search は 0013 で作っていた tsvector のインデックス（日本語を分かち書きしないため使わなくなった）
+POSTGRES_DROP = [f'DROP INDEX IF EXISTS {POSTGRES_INDEX}', 'DROP INDEX IF EXISTS ix_post_search']
+
+
+def create_search_index(conn):
+    for statement in {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_index(conn):
+    for statement in {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(conn.dialect.name, []):
+        conn.exec_driver_sql(statement)
+
+
+# SQLite で post_fts があるのにトリガーが欠けていれば（batch_alter_table で post を作り直した後）作り直す
+def repair_search_index(conn):
+    if conn.dialect.name != 'sqlite':
+        return False
+    names = {name for (name,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE name = ? OR (type = 'trigger' AND tbl_name = 'post')", (FTS_TABLE,))}
+    if FTS_TABLE not in names or all(trigger in names for trigger in FTS_TRIGGERS):
+        return False
+    create_search_index(conn)
+    return True
+
+
+def fts_query(terms):
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _contains(term):
+    return or_(*(getattr(Post, name).contains(term, autoescape=True) for name in SEARCH_COLUMNS))
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+# 空白で区切った語を全て含む問題を ID 順に limit 件返す（after_id より後）。(問題, 次のページの after_id) を返す
+# 索引で引ける語が無い検索は after_id の後 scan_rows 件の範囲だけを調べ、見つからなくても次の範囲へ進めるようにする
+def search_posts(q, after_id=0, limit=50, scan_rows=5000):
+    upto_id = None
+    if not any(len(term) >= TRIGRAM_LENGTH for term in q.split()):
+        upto_id = db.session.query(Post.id).filter(Post.id > after_id).order_by(Post.id.asc()).offset(
+            scan_rows - 1).limit(1).scalar()
+    posts = search_query(q, after_id, limit + 1, upto_id).all()
+    if len(posts) > limit:
+        return posts[:limit], posts[limit - 1].id
+    return posts, upto_id
+
+
+def search_query(q, after_id=0, limit=50, upto_id=None):
+    terms = q.split()
+    query = Post.query.options(joinedload(Post.unit).joinedload(Unit.genre))
+    if upto_id is not None:
+        query = query.filter(Post.id <= upto_id)
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        query = query.filter(*(_contains(term) for term in terms if len(term) < TRIGRAM_LENGTH))
+        indexed = [term for term in terms if len(term) >= TRIGRAM_LENGTH]
+        if indexed:
+            # post_fts の rowid 順に読み、post は主キーで引く（一致した行を全て並べ替えずに limit 件で止まる）
+            fts = table(FTS_TABLE, column('rowid'))
+            return query.join(fts, fts.c.rowid == Post.id).filter(
+                literal_column(FTS_TABLE).op('MATCH')(fts_query(indexed)), fts.c.rowid > after_id
+            ).order_by(fts.c.rowid.asc()).limit(limit)
+    elif dialect == 'postgresql':
+        document = literal_column(POSTGRES_DOCUMENT)
+        query = query.filter(*(document.ilike('%' + escape_like(term) + '%', escape='\\') for term in terms))
+    else:
+        query = query.filter(*(_contains(term) for term in terms))
+    return query.filter(Post.id > after_id).order_by(Post.id.asc()).limit(limit)
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """問題の全文検索の索引を作り直す"""
+    with db.engine.begin() as conn:
+        drop_search_index(conn)
+        create_search_index(conn)
+    click.echo('全文検索の索引を作り直しました')
@@ -0,0 +1,145 @@
+from collections import Counter
+from datetime import datetime
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import case, event, func
+from shared.db import db, upsert
+from shared.models.users import SqlStat
+import pytz
+import re
+import threading
+import time
+
+
+# IN (?, ?, ...) や %(name)s の違いを吸収して同じ形のSQLをまとめる
+def normalize_statement(statement):
+    statement = re.sub(r'%\(\w+\)s|\$\d+|:\w+', '?', statement)
+    statement = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(?)', statement)
+    return ' '.join(statement.split())
+
+
+# リクエストごとのSQL件数・DB時間・最も遅いSQL・同じSQLの繰り返し（N+1）を記録する
+# 結果は Server-Timing ヘッダで返し、エンドポイントごとの集計を一定間隔で sql_stat に書き込む
+class SQLStats:
+    def __init__(self):
+        self._pending = {}
+        self._flushed_at = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_STATS_ENABLED', True)
+        app.config.setdefault('SQL_STATS_N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('SQL_STATS_FLUSH_INTERVAL', 30)
+        app.extensions['sql_stats'] = self
+        if not app.config['SQL_STATS_ENABLED']:
+            return
+
+        with app.app_context():
+            # レプリカ（SQLALCHEMY_BINDS）に送ったSQLも数える
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _start_request(self):
+        g.sql_stats = dict(count=0, seconds=0.0, slowest=(0.0, None), patterns=Counter())
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_stats_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['sql_stats_start'].pop()
+        if not has_request_context():
+            return
+        stats = g.get('sql_stats')
+        if stats is None:
+            return
+        stats['count'] += 1
+        stats['seconds'] += elapsed
+        if elapsed > stats['slowest'][0]:
+            stats['slowest'] = (elapsed, statement)
+        stats['patterns'][normalize_statement(statement)] += 1
+
+    def _finish_request(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None or request.endpoint is None:
+            return response
+
+        threshold = current_app.config['SQL_STATS_N_PLUS_ONE_THRESHOLD']
+        repeated = [(n, sql) for sql, n in stats['patterns'].items() if n >= threshold]
+        n_plus_one = max(repeated)[1] if repeated else None
+        if n_plus_one:
+            current_app.logger.warning('N+1 suspected in %s: %s', request.endpoint, n_plus_one)
+
+        db_ms = stats['seconds'] * 1000
+        response.headers.add('Server-Timing', f'db;dur={db_ms:.2f};desc="{stats["count"]} queries"')
+
+        self._record(current_app._get_current_object(), request.endpoint, stats, db_ms, n_plus_one)
+        return response
+
+    def _record(self, app, endpoint, stats, db_ms, n_plus_one):
+        key = (app.import_name, endpoint)
+        slowest_ms = stats['slowest'][0] * 1000
+        with self._lock:
+            entry = self._pending.setdefault(key, dict(requests=0, queries=0, db_ms=0.0, max_queries=0,
+                                                       slowest_ms=0.0, slowest_sql=None,
+                                                       n_plus_one=0, n_plus_one_sql=None))
+            entry['requests'] += 1
+            entry['queries'] += stats['count']
+            entry['db_ms'] += db_ms
+            entry['max_queries'] = max(entry['max_queries'], stats['count'])
+            if slowest_ms > entry['slowest_ms']:
+                entry['slowest_ms'] = slowest_ms
+                entry['slowest_sql'] = stats['slowest'][1]
+            if n_plus_one:
+                entry['n_plus_one'] += 1
+                entry['n_plus_one_sql'] = n_plus_one
+
+            now = time.monotonic()
+            due = now - self._flushed_at.setdefault(app.import_name, now) >= app.config['SQL_STATS_FLUSH_INTERVAL']
+            if due:
+                self._flushed_at[app.import_name] = now
+        if due:
+            # 書き込みはリクエストの応答を待たせないよう別スレッドで行う
+            threading.Thread(target=self.flush, args=(app,), name='sql-stats-flush', daemon=True).start()
+
+    # 溜めた集計を sql_stat に加算する（別のアプリコンテキストで書き込む）
+    # 複数ワーカーが同時に同じエンドポイントの最初の行を書いても重ならないよう upsert で加算する
+    # 計測のための書き込みなので、失敗してもログに残して捨てる（リクエストを失敗させない）
+    def flush(self, app):
+        with self._lock:
+            pending = {key: entry for key, entry in self._pending.items() if key[0] == app.import_name}
+            for key in pending:
+                del self._pending[key]
+            self._flushed_at[app.import_name] = time.monotonic()
+        if not pending:
+            return
+
+        now = datetime.now(pytz.timezone('Asia/Tokyo'))
+        rows = [dict(app_name=app_name, endpoint=endpoint, updated_at=now, **entry)
+                for (app_name, endpoint), entry in pending.items()]
+
+        def added(excluded):
+            slower = excluded.slowest_ms > SqlStat.slowest_ms
+            return dict(
+                requests=SqlStat.requests + excluded.requests,
+                queries=SqlStat.queries + excluded.queries,
+                db_ms=SqlStat.db_ms + excluded.db_ms,
+                n_plus_one=SqlStat.n_plus_one + excluded.n_plus_one,
+                max_queries=case((excluded.max_queries > SqlStat.max_queries, excluded.max_queries),
+                                 else_=SqlStat.max_queries),
+                slowest_ms=case((slower, excluded.slowest_ms), else_=SqlStat.slowest_ms),
+                slowest_sql=case((slower, excluded.slowest_sql), else_=SqlStat.slowest_sql),
+                n_plus_one_sql=func.coalesce(excluded.n_plus_one_sql, SqlStat.n_plus_one_sql),
+                updated_at=excluded.updated_at)
+
+        with app.app_context():
+            try:
+                db.session.execute(upsert(SqlStat, added), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception('sql_stats: %d 件の集計を書き込めなかったため破棄しました', len(rows))
+
+
+sql_stats = SQLStats()
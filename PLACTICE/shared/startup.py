@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+from flask.cli import with_appcontext
+from flask import current_app
+from jinja2 import ChoiceLoader, FileSystemLoader, FileSystemBytecodeCache
+import click
+import os
+import time
+
+# PLACTICE ディレクトリ（起動時のカレントディレクトリに依存しないよう、パスはここから組み立てる）
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# アプリ生成の段階ごとの所要時間を記録する（app.extensions['startup_timings'] に秒で残す）
+class StartupTimer:
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def finish(self, app):
+        app.extensions['startup_timings'] = self.timings
+        app.logger.info('startup: %s', format_timings(self.timings))
+
+
+def format_timings(timings):
+    return ', '.join(f'{k}={v * 1000:.1f}ms' for k, v in timings.items())
+
+
+# テンプレートの読み込み先を絶対パスで設定し、コンパイル結果をファイルにキャッシュする
+# キャッシュ先は JINJA_CACHE_DIR（空にすると無効）。書き込めない場合は使わない
+def configure_templates(app, app_dir):
+    app.jinja_loader = ChoiceLoader([
+        FileSystemLoader(os.path.join(BASE_DIR, app_dir, 'templates')),
+        FileSystemLoader(os.path.join(BASE_DIR, 'shared', 'templates')),
+    ])
+
+    cache_dir = os.environ.get('JINJA_CACHE_DIR', os.path.join(BASE_DIR, 'instance', 'jinja_cache'))
+    if cache_dir:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError:
+            cache_dir = None
+    if cache_dir and os.access(cache_dir, os.W_OK):
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(cache_dir))
+    app.config['JINJA_CACHE_DIR'] = cache_dir or None
+
+
+def compile_templates(app):
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_templates_command():
+    """テンプレートをコンパイルしてバイトコードキャッシュに書き出す（イメージのビルド時に実行する）"""
+    app = current_app._get_current_object()
+    if not app.config.get('JINJA_CACHE_DIR'):
+        raise click.ClickException('JINJA_CACHE_DIR が無効か書き込めません')
+    names = compile_templates(app)
+    click.echo(f"{len(names)} 件のテンプレートを {app.config['JINJA_CACHE_DIR']} に書き出しました")
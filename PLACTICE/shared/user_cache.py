@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from flask_login import UserMixin
+from shared.db import db
+from shared.models.users import User
+import json
+import threading
+import time
+
+
+# ログイン中ユーザーの id / username / role だけを持つ軽量オブジェクト
+class CachedUser(UserMixin):
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+    def to_dict(self):
+        return dict(id=self.id, username=self.username, role=self.role)
+
+
+class LocalBackend:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+# 複数ワーカー・両アプリで共有する場合（redis パッケージが必要）
+class RedisBackend:
+    def __init__(self, url, prefix='plactice:user:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('USER_CACHE_REDIS_URL を使うには redis パッケージが必要です')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + str(key))
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + str(key), json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+# user_loader 用の短時間キャッシュ。権限変更・削除時は invalidate で即時に破棄する
+# invalidate は全ワーカー・両アプリに届かないと意味が無いため、既定では共有の Redis（USER_CACHE_REDIS_URL）がある場合だけ使う
+# USER_CACHE_LOCAL を有効にするとプロセス内に持つ（他のプロセスには最長 USER_CACHE_TTL 秒、古い権限が残る）
+class UserCache:
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.backend = None
+
+    def init_app(self, app):
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        redis_url = app.config.get('USER_CACHE_REDIS_URL')
+        if redis_url:
+            self.backend = RedisBackend(redis_url)
+        elif app.config.get('USER_CACHE_LOCAL'):
+            self.backend = LocalBackend()
+        else:
+            self.backend = None
+        app.extensions['user_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None and self.ttl > 0
+
+    def get(self, user_id):
+        if self.enabled:
+            data = self.backend.get(user_id)
+            if data is not None:
+                return CachedUser(**data)
+
+        row = db.session.query(User.id, User.username, User.role).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(row.id, row.username, row.role)
+        if self.enabled:
+            self.backend.set(user_id, user.to_dict(), self.ttl)
+        return user
+
+    def invalidate(self, user_id):
+        if self.backend is not None:
+            self.backend.delete(user_id)
+
+
+user_cache = UserCache()
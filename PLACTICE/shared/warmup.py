@@ -0,0 +1,29 @@
+from sqlalchemy import text
+from shared.db import db
+from shared.catalog import catalog
+from shared.startup import compile_templates
+import time
+
+
+# ワーカー起動直後に呼ぶ。最初のリクエストで発生する接続・テンプレートのコンパイル・カタログ読み込みを先に済ませる
+def warm_up(app):
+    timings = {}
+
+    start = time.perf_counter()
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+    timings['db'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compile_templates(app)
+    timings['templates'] = time.perf_counter() - start
+
+    if 'catalog' in app.extensions:
+        start = time.perf_counter()
+        with app.app_context():
+            catalog.get_genres()
+            db.session.remove()
+        timings['catalog'] = time.perf_counter() - start
+
+    return timings
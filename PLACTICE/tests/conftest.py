@@ -0,0 +1,66 @@
+import os
+import tempfile
+
+# アプリを読み込む前に設定する。DB はテスト用の SQLite ファイルで、スキーマは admin_app の作成時にマイグレーションで作る
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['AUTO_MIGRATE'] = '1'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ['PASSWORD_HASH_LOCK_DIR'] = tempfile.mkdtemp()
+
+import pytest
+from admin_app import admin_app
+from quiz_app import quiz_app
+from shared.db import db
+from shared.catalog import CatalogCache, catalog
+from shared.page_cache import fragment_cache
+from shared.leaderboard import leaderboard
+from shared.sampling import sampler
+from shared.passwords import password_hasher
+from shared.models.users import User, Genre, Unit, Post
+
+
+@pytest.fixture(scope='session')
+def app():
+    admin_app()
+    # admin_app は共有のカタログの版数確認を毎回にするため、quiz_app の既定値に戻してから作る
+    catalog.version_check_interval = CatalogCache().version_check_interval
+    app = quiz_app()
+    # 計測中に SQL の統計を別スレッドで書き込まないようにする
+    app.config['SQL_STATS_FLUSH_INTERVAL'] = 24 * 3600
+    return app
+
+
+# 全テーブルを空にして、ユーザー player と、units 個の単元（各 posts 問）を持つジャンルを1つ作る
+@pytest.fixture
+def seed(app):
+    def seed(units=3, posts=5):
+        with app.app_context():
+            for table in reversed(db.metadata.sorted_tables):
+                db.session.execute(table.delete())
+            db.session.add(User(username='player', password=password_hasher.hash('password'), role='player'))
+            genre = Genre(name='genre')
+            db.session.add(genre)
+            db.session.flush()
+            for n in range(units):
+                unit = Unit(name=f'unit{n}', genre_id=genre.id)
+                db.session.add(unit)
+                db.session.flush()
+                db.session.add_all([Post(question=f'question{k}', select1='a', select2='b', select3='c', select4='d',
+                                         answer='a', unit_id=unit.id) for k in range(posts)])
+            db.session.commit()
+            genre_id = genre.id
+        for cache in (catalog, fragment_cache, leaderboard, sampler):
+            cache.clear()
+        return genre_id
+    return seed
+
+
+# seed の後に呼び、player でログインしたテストクライアントを返す
+@pytest.fixture
+def login(app):
+    def login():
+        client = app.test_client()
+        response = client.post('/', data=dict(username='player', password='password'))
+        assert response.status_code == 302
+        return client
+    return login
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from shared.db import db
+from shared.models.users import Unit, Post, AnswerSession, QuizAttempt
+
+
+def first_unit(app):
+    with app.app_context():
+        unit = Unit.query.order_by(Unit.id.asc()).first()
+        post_ids = [post_id for (post_id,) in db.session.query(Post.id).filter(
+            Post.unit_id == unit.id).order_by(Post.id.asc())]
+        return unit.id, unit.genre_id, post_ids
+
+
+def attempt_id(response):
+    return int(response.headers['Location'].rsplit('attempt=', 1)[1])
+
+
+# 単元一覧から始めると、古い終わっていない挑戦（開始時刻・以前の解答）を持ち込まずに新しい挑戦になる
+def test_start_does_not_reuse_stale_attempt(app, seed, login):
+    seed(1, 2)
+    client = login()
+    unit_id, genre_id, post_ids = first_unit(app)
+
+    old = attempt_id(client.post(f'/quiz/{unit_id}/start', data=dict(mode='order')))
+    client.post(f'/answer/{post_ids[0]}', data=dict(selected='a', attempt_id=old))
+    with app.app_context():
+        db.session.get(QuizAttempt, old).started_at -= timedelta(days=30)
+        db.session.commit()
+
+    new = attempt_id(client.post(f'/quiz/{unit_id}/start', data=dict(mode='order')))
+    assert new != old
+    # 1問目を直接開いても古い挑戦は使わない
+    page = client.get(f'/quiz/{unit_id}/{genre_id}/{post_ids[0]}').get_data(as_text=True)
+    assert f'value="{old}"' not in page
+
+    for post_id in post_ids:
+        client.post(f'/answer/{post_id}', data=dict(selected='a', attempt_id=new))
+    assert client.get(f'/result_unit/{unit_id}?attempt={new}').status_code == 200
+    with app.app_context():
+        session = AnswerSession.query.one()
+        assert session.total_count == len(post_ids)
+        assert session.ended_at - session.started_at < timedelta(minutes=1)
+
+
+# 開き直したときは、始めたばかりのまだ答えていない挑戦を使い回す
+def test_reload_reuses_unanswered_attempt(app, seed, login):
+    seed(1, 2)
+    client = login()
+    unit_id, genre_id, post_ids = first_unit(app)
+    for _ in range(3):
+        assert client.get(f'/quiz/{unit_id}/{genre_id}/{post_ids[0]}').status_code == 200
+        assert client.get(f'/api/quiz/{unit_id}').status_code == 200
+    with app.app_context():
+        assert QuizAttempt.query.count() == 1
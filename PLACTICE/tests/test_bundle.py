@@ -0,0 +1,41 @@
+from datetime import datetime
+import pytest
+from shared.db import db
+from shared.models.users import User, Unit, AnswerSession
+
+
+def first_unit_id(app):
+    with app.app_context():
+        return db.session.query(Unit.id).order_by(Unit.id.asc()).first()[0]
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'answers', 3, {'answers': {'1': 'a'}, 'attempt_id': True},
+                                  {'answers': {'1': 1}}, {'answers': []}])
+def test_invalid_json_is_rejected(app, seed, login, body):
+    seed(1, 2)
+    client = login()
+    assert client.post(f'/api/quiz/{first_unit_id(app)}', json=body).status_code == 400
+
+
+# 1問も答えていない送信は記録せず 400 を返し、解答履歴の画面は表示できる
+def test_empty_submission_is_rejected(app, seed, login):
+    seed(1, 2)
+    client = login()
+    unit_id = first_unit_id(app)
+    assert client.post(f'/api/quiz/{unit_id}', json={'answers': {}}).status_code == 400
+    assert client.post(f'/quiz_all/{unit_id}', data={}).status_code == 400
+    with app.app_context():
+        assert AnswerSession.query.count() == 0
+    assert client.get('/history').status_code == 200
+
+
+# 以前に作られた解答数0の解答履歴があっても表示できる
+def test_history_with_empty_session(app, seed, login):
+    seed(1, 2)
+    client = login()
+    with app.app_context():
+        now = datetime.utcnow()
+        db.session.add(AnswerSession(user_id=db.session.query(User.id).scalar(), unit_id=first_unit_id(app),
+                                     started_at=now, ended_at=now, correct_count=0, total_count=0))
+        db.session.commit()
+    assert client.get('/history').status_code == 200
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+from shared.db import db
+from shared.leaderboard import ELAPSED_LIMIT_MS, leaderboard, rebuild
+from shared.models.users import User, Unit, AnswerSession, LeaderboardEntry
+
+
+def player_and_unit(app):
+    with app.app_context():
+        return db.session.query(User.id).scalar(), db.session.query(Unit.id).order_by(Unit.id.asc()).first()[0]
+
+
+# 自己ベストを更新した記録だけが残り、経過時間は上限で丸める
+def test_record_keeps_best(app, seed):
+    seed(1, 2)
+    user_id, unit_id = player_and_unit(app)
+    now = datetime.utcnow()
+    with app.app_context():
+        for correct, seconds in [(1, 10), (2, 20), (1, 5), (2, 60 * 24 * 3600)]:
+            leaderboard.record(user_id, unit_id, correct, 2, seconds, now)
+            db.session.commit()
+        entry = db.session.get(LeaderboardEntry, (unit_id, user_id))
+        assert (entry.correct_count, entry.elapsed_ms) == (2, 20000)
+
+        db.session.execute(db.delete(LeaderboardEntry))
+        leaderboard.record(user_id, unit_id, 2, 2, 60 * 24 * 3600, now)
+        db.session.commit()
+        assert db.session.get(LeaderboardEntry, (unit_id, user_id)).elapsed_ms == ELAPSED_LIMIT_MS
+
+
+# 作り直しは全問題に答えた解答履歴の最高記録で置き換える
+def test_rebuild_replaces_entries(app, seed):
+    seed(1, 2)
+    user_id, unit_id = player_and_unit(app)
+    start = datetime(2026, 1, 1)
+    with app.app_context():
+        leaderboard.record(user_id, unit_id, 0, 2, 1, start)
+        db.session.add_all([
+            AnswerSession(user_id=user_id, unit_id=unit_id, started_at=start, ended_at=start + timedelta(seconds=30),
+                          correct_count=2, total_count=2),
+            AnswerSession(user_id=user_id, unit_id=unit_id, started_at=start, ended_at=start + timedelta(seconds=5),
+                          correct_count=1, total_count=1),
+        ])
+        db.session.commit()
+        rebuild(echo=lambda message: None)
+        entries = [(e.correct_count, e.elapsed_ms) for e in LeaderboardEntry.query]
+        assert entries == [(2, 30000)]
@@ -0,0 +1,55 @@
+import threading
+import time
+import pytest
+from flask import Flask
+from werkzeug.exceptions import ServiceUnavailable
+from shared.passwords import PasswordHasher
+
+
+def hasher(tmp_path, **config):
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_LOCK_DIR=str(tmp_path), **config)
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+    return hasher
+
+
+# 計算中の間に来た分は待ち行列で待ち、queue 件を超えた分だけ 503 になる
+def test_waits_in_bounded_queue(tmp_path):
+    h = hasher(tmp_path, PASSWORD_HASH_QUEUE=1, PASSWORD_HASH_WAIT=5)
+    started = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        time.sleep(0.3)
+        return 'done'
+
+    def run(func):
+        try:
+            results.append(h._run(func))
+        except ServiceUnavailable:
+            results.append(503)
+
+    first = threading.Thread(target=run, args=(slow,))
+    first.start()
+    started.wait()
+    waiting = threading.Thread(target=run, args=(lambda: 'waited',))
+    waiting.start()
+    time.sleep(0.1)
+    run(lambda: 'overflow')
+    first.join()
+    waiting.join()
+    assert sorted(map(str, results)) == ['503', 'done', 'waited']
+
+
+# 待っても空かなければ 503
+def test_wait_times_out(tmp_path):
+    h = hasher(tmp_path, PASSWORD_HASH_QUEUE=1, PASSWORD_HASH_WAIT=0)
+    token = h._slots.acquire()
+    try:
+        with pytest.raises(ServiceUnavailable):
+            h._run(lambda: None)
+    finally:
+        h._slots.release(token)
+    assert h._run(lambda: 'ok') == 'ok'
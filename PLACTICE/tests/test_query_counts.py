@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import event
+from shared.db import db
+from shared.models.users import Unit, Post
+
+
+# url を GET したときに発行された SQL 文
+def statements(app, client, url):
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return executed
+
+
+# 画面ごとの SQL 文の数（キャッシュが空の1回目, 2回目）。単元が増えても変わらないこと
+# home: ユーザー・成績の集計・カタログの版数・ジャンル一覧
+# unit: ユーザー・カタログの版数・ジャンル一覧・単元ごとの成績・続きの挑戦・単元ごとの問題数（1クエリ）
+# quiz: ユーザー・カタログの版数・ジャンル一覧・単元・単元の問題・ジャンル・終わっていない挑戦・挑戦の作成と読み直し・出題順
+#       2回目は作成した挑戦を使い回すため、ユーザー・終わっていない挑戦・解答の有無・出題順だけ
+EXPECTED = {'home': (4, 2), 'unit': (6, 3), 'quiz': (10, 4)}
+
+
+def urls(app, genre_id):
+    with app.app_context():
+        unit_id = db.session.query(Unit.id).order_by(Unit.id.asc()).first()[0]
+        post_id = db.session.query(Post.id).filter(Post.unit_id == unit_id).order_by(Post.id.asc()).first()[0]
+    return {'home': '/home', 'unit': f'/unit/{genre_id}', 'quiz': f'/quiz/{unit_id}/{genre_id}/{post_id}'}
+
+
+@pytest.mark.parametrize('page', ['home', 'unit', 'quiz'])
+@pytest.mark.parametrize('units', [2, 30])
+def test_statement_count(app, seed, login, units, page):
+    genre_id = seed(units)
+    client = login()
+    url = urls(app, genre_id)[page]
+    counts = (len(statements(app, client, url)), len(statements(app, client, url)))
+    assert counts == EXPECTED[page]
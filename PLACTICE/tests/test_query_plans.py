@@ -0,0 +1,10 @@
+from shared.query_plans import check_query_plans
+
+
+# flask check-query-plans と同じ確認。主要クエリの EXPLAIN に全件走査が含まれていれば失敗する
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        results = list(check_query_plans())
+    assert results
+    failed = {name: plan for name, plan, scans in results if scans}
+    assert not failed
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert
+from shared.db import db
+from shared.models.users import User, Post, AnswerRecord, AnswerRecordArchive, AnswerStatWatermark
+from shared.retention import archive_answers
+
+
+# 古い解答 old 件のあとに新しい解答 new 件を書き、分析は全て集計済みにする
+def answers(app, old, new, watermark=True):
+    with app.app_context():
+        user_id = db.session.query(User.id).scalar()
+        post_id = db.session.query(Post.id).order_by(Post.id.asc()).first()[0]
+        start = datetime(2025, 1, 1)
+        db.session.execute(insert(AnswerRecord), [
+            dict(user_id=user_id, post_id=post_id, selected_answer='a', is_correct=True,
+                 answered_at=start + timedelta(days=0 if n < old else 365, seconds=n))
+            for n in range(old + new)])
+        if watermark:
+            last_id = db.session.query(func.max(AnswerRecord.id)).scalar()
+            db.session.add(AnswerStatWatermark(id=1, last_record_id=last_id))
+        db.session.commit()
+    return datetime(2025, 6, 1)
+
+
+# 保存期間内の解答を含むチャンクまで移したら止まり、その先は読まない
+def test_archive_stops_at_cutoff(app, seed):
+    seed(1, 1)
+    cutoff = answers(app, 100, 900)
+    scans = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT answer_record.id, answer_record.answered_at'):
+            scans.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            moved = archive_answers(cutoff, chunk_size=40, echo=lambda message: None)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        assert moved == 100
+        assert AnswerRecordArchive.query.count() == 100
+        assert AnswerRecord.query.count() == 900
+    assert len(scans) == 3
+
+
+# 分析が一度も集計されていなければ何も移さず、そのことを知らせる
+def test_archive_without_watermark(app, seed):
+    seed(1, 1)
+    cutoff = answers(app, 10, 0, watermark=False)
+    messages = []
+    with app.app_context():
+        assert archive_answers(cutoff, echo=messages.append) == 0
+        assert AnswerRecord.query.count() == 10
+    assert messages